@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark on a local LLM backend.
+
+Times chunk extraction, standardization, inference and visualization on
+documents of increasing size without network access or API quota. Responses
+come from the synthetic backend (or a recording, with --backend replay), so
+results are comparable between runs and regressions show up before production:
+
+    python benchmarks/pipeline_benchmark.py --chunks 10 100 1000 --output bench.json
+    python benchmarks/pipeline_benchmark.py --chunks 10 100 --baseline bench.json
+"""
+import sys
+import os
+import io
+import copy
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+# Add the project root to the Python path to find the module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_graph.config import load_config
+from knowledge_graph.main import process_text_in_chunks
+from knowledge_graph.event_extraction import resolve_events_with_llm, infer_event_relationships
+from knowledge_graph.entity_standardization import standardize_entities, infer_relationships
+from knowledge_graph.visualization import visualize_knowledge_graph
+
+STAGES = ["extraction", "standardization", "inference", "visualization"]
+
+
+def make_document(chunks):
+    """Build a pre-chunked document (the synthetic backend ignores its content)."""
+    return "\n".join(
+        f"[Đoạn {i + 1}]\nĐây là đoạn văn bản thử nghiệm số {i + 1} dùng để đo hiệu năng."
+        for i in range(chunks)
+    )
+
+
+def make_config(base_config, args):
+    """Point the configuration at the local backend and keep every run independent."""
+    config = copy.deepcopy(base_config)
+    llm_config = config["llm"]
+    llm_config["backend"] = args.backend
+    llm_config["api_key"] = [f"benchmark-key-{i + 1}" for i in range(args.keys)]
+    llm_config["rpm_limit"] = 0
+    llm_config["tpm_limit"] = 0
+    if args.replay_path:
+        llm_config["replay_path"] = args.replay_path
+    if args.latency is not None:
+        llm_config.setdefault("synthetic", {})["latency"] = args.latency
+    
+    config.setdefault("cache", {})["enabled"] = False
+    config.setdefault("output", {})["stream"] = False
+    config.setdefault("chunking", {})["already_chunked"] = True
+    config["standardization"]["enabled"] = False
+    config["inference"]["enabled"] = False
+    config["next_chunk"] = 1
+    return config
+
+
+def run_size(base_config, args, chunks):
+    """Run every stage on a document of the given number of chunks."""
+    config = make_config(base_config, args)
+    config["input_name"] = f"benchmark_{chunks}"
+    timings = {}
+    log = io.StringIO()
+    
+    with contextlib.redirect_stdout(log):
+        start = time.perf_counter()
+        triples = process_text_in_chunks(config, make_document(chunks))
+        timings["extraction"] = time.perf_counter() - start
+        extracted = len(triples)
+        
+        start = time.perf_counter()
+        triples = resolve_events_with_llm(triples, config)
+        triples = standardize_entities(triples, config)
+        timings["standardization"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        triples = infer_event_relationships(triples, config)
+        triples = infer_relationships(triples, config)
+        timings["inference"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        stats = visualize_knowledge_graph(triples, f"benchmark_{chunks}.html", config=config)
+        timings["visualization"] = time.perf_counter() - start
+    
+    return {
+        "chunks": chunks,
+        "triples_extracted": extracted,
+        "triples_final": len(triples),
+        "nodes": stats["nodes"],
+        "edges": stats["edges"],
+        "seconds": {stage: round(timings[stage], 3) for stage in STAGES},
+        "total_seconds": round(sum(timings.values()), 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare stage timings with a baseline run.
+    
+    Returns:
+        List of regression messages (empty if none)
+    """
+    baseline_by_size = {result["chunks"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        previous = baseline_by_size.get(result["chunks"])
+        if previous is None:
+            continue
+        for stage in STAGES:
+            before = previous["seconds"].get(stage)
+            after = result["seconds"][stage]
+            # Ignore sub-100ms stages, whose timings are mostly noise
+            if before is not None and after > 0.1 and after > before * (1 + tolerance):
+                regressions.append(f"{result['chunks']} chunks, {stage}: {before:.2f}s -> {after:.2f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the knowledge graph pipeline on a local LLM backend")
+    parser.add_argument('--chunks', type=int, nargs='+', default=[10, 100, 1000], help='Document sizes to benchmark, in chunks')
+    parser.add_argument('--config', type=str, default='config.toml', help='Base configuration file')
+    parser.add_argument('--backend', choices=['synthetic', 'replay'], default='synthetic', help='LLM backend answering the requests')
+    parser.add_argument('--replay-path', type=str, default=None, help='Recording served by the replay backend')
+    parser.add_argument('--latency', type=float, default=None, help='Synthetic response time in seconds (overrides the config)')
+    parser.add_argument('--keys', type=int, default=4, help='Number of fake API keys (sets the default number of chunk workers)')
+    parser.add_argument('--output', type=str, default=None, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare with the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown over the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+    
+    base_config = load_config(args.config)
+    if base_config is None:
+        print(f"Failed to load configuration from {args.config}. Exiting.")
+        sys.exit(2)
+    # Paths are used after moving to the scratch directory
+    output = os.path.abspath(args.output) if args.output else None
+    if args.replay_path:
+        args.replay_path = os.path.abspath(args.replay_path)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    
+    results = []
+    print(f"{'chunks':>7} {'triples':>8} " + " ".join(f"{stage:>15}" for stage in STAGES) + f" {'total':>9}")
+    # Run in a scratch directory: the pipeline writes its checkpoints and outputs there
+    with tempfile.TemporaryDirectory() as work_directory:
+        cwd = os.getcwd()
+        os.chdir(work_directory)
+        try:
+            for chunks in args.chunks:
+                result = run_size(base_config, args, chunks)
+                results.append(result)
+                print(f"{chunks:>7} {result['triples_final']:>8} "
+                      + " ".join(f"{result['seconds'][stage]:>14.2f}s" for stage in STAGES)
+                      + f" {result['total_seconds']:>8.2f}s")
+        finally:
+            os.chdir(cwd)
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump({"backend": args.backend, "results": results}, file, indent=2)
+        print(f"Stored results at: {output}")
+    
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️  {len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f" - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No stage slower than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
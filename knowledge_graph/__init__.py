@@ -5,7 +5,7 @@ A tool that takes text input and generates an interactive knowledge graph visual
 """
 
 from knowledge_graph.visualization import visualize_knowledge_graph, sample_data_visualization
-from knowledge_graph.llm import call_llm, extract_json_from_text
+from knowledge_graph.llm import call_llm, acall_llm, extract_json_from_text
 from knowledge_graph.config import load_config
 
 __version__ = "0.1.0"
@@ -0,0 +1,421 @@
+"""Pluggable transports behind the LLM client.
+
+call_llm and acall_llm decide what to send, with which key and when to retry;
+a backend only delivers one request and reports its outcome. Besides the HTTP
+backend, a record/replay backend and a synthetic backend allow running and
+benchmarking the pipeline without network access or API quota.
+"""
+import os
+import re
+import ast
+import json
+import time
+import random
+import asyncio
+import hashlib
+import requests
+from threading import Lock
+from collections import namedtuple
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency, only needed by AsyncLLM / acall_llm
+    aiohttp = None
+
+from knowledge_graph.text_utils import estimate_tokens
+from knowledge_graph.prompts import (
+    PREKG_ENTITY_RESOLUTION_SYSTEM_PROMPT,
+    CLAIM_EXTRACTION_SYSTEM_PROMPT,
+    ENTITY_RESOLUTION_SYSTEM_PROMPT,
+)
+from knowledge_graph.event_prompts import (
+    EVENT_IDENTIFICATION_SYSTEM_PROMPT,
+    EVENT_ATTRIBUTE_SYSTEM_PROMPT,
+    EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT,
+    EVENT_RESOLUTION_SYSTEM_PROMPT,
+)
+
+
+# Outcomes of one request, sent back to the retry logic of knowledge_graph.llm
+Response = namedtuple("Response", ["status_code", "body", "text"])
+TransportError = namedtuple("TransportError", ["timeout", "error"])
+
+
+def _build_headers(api_key):
+    """Prepare headers for the given API key."""
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f"Bearer {api_key}"
+    }
+
+
+def request_key(payload):
+    """Get a stable identifier of a chat completion request body."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _completion(content, payload):
+    """Wrap generated text in a chat completion response."""
+    prompt_text = "".join(
+        message["content"] if isinstance(message["content"], str)
+        else "".join(part.get("text", "") for part in message["content"])
+        for message in payload.get("messages", [])
+    )
+    body = {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": estimate_tokens(prompt_text),
+            "completion_tokens": estimate_tokens(content),
+        },
+    }
+    return Response(200, body, json.dumps(body, ensure_ascii=False))
+
+
+class HTTPBackend:
+    """Send requests to the configured endpoint (the default backend)."""
+    
+    def post(self, session, base_url, api_key, payload):
+        """Send one blocking request and wrap its outcome."""
+        try:
+            response = session.post(
+                base_url,
+                headers=_build_headers(api_key),
+                json=payload,
+                timeout=120  # 2 minute timeout
+            )
+        except requests.exceptions.Timeout as e:
+            return TransportError(True, e)
+        except requests.exceptions.RequestException as e:
+            return TransportError(False, e)
+        
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return Response(response.status_code, body, response.text)
+    
+    async def apost(self, session, base_url, api_key, payload):
+        """Send one non-blocking request and wrap its outcome."""
+        try:
+            async with session.post(
+                base_url,
+                headers=_build_headers(api_key),
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=120)  # 2 minute timeout
+            ) as response:
+                status_code = response.status
+                text = await response.text()
+        except asyncio.TimeoutError as e:
+            return TransportError(True, e)
+        except aiohttp.ClientError as e:
+            return TransportError(False, e)
+        
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = None
+        return Response(status_code, body, text)
+
+
+class RecordingBackend:
+    """
+    Send requests through another backend and record every successful response.
+    
+    The recording is a JSONL file of {"key", "latency", "body"} records that
+    ReplayBackend can serve later.
+    """
+    
+    def __init__(self, path, inner=None):
+        """
+        Initialize the recorder, appending to an existing recording.
+        
+        Args:
+            path: Path of the JSONL recording
+            inner: Backend doing the actual requests (HTTPBackend by default)
+        """
+        self.path = path
+        self.inner = inner or HTTPBackend()
+        self._lock = Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    def _record(self, payload, outcome, latency):
+        if isinstance(outcome, Response) and outcome.status_code == 200 and outcome.body is not None:
+            record = {"key": request_key(payload), "latency": round(latency, 3), "body": outcome.body}
+            with self._lock, open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return outcome
+    
+    def post(self, session, base_url, api_key, payload):
+        started_at = time.time()
+        outcome = self.inner.post(session, base_url, api_key, payload)
+        return self._record(payload, outcome, time.time() - started_at)
+    
+    async def apost(self, session, base_url, api_key, payload):
+        started_at = time.time()
+        outcome = await self.inner.apost(session, base_url, api_key, payload)
+        return self._record(payload, outcome, time.time() - started_at)
+
+
+class ReplayBackend:
+    """
+    Serve the responses of a recording made by RecordingBackend.
+    
+    Requests missing from the recording fail with a 404 (not retried), so a
+    replayed run never reaches the network.
+    """
+    
+    def __init__(self, path, speed=0.0):
+        """
+        Load a recording.
+        
+        Args:
+            path: Path of the JSONL recording
+            speed: Fraction of the recorded latency to wait before answering (0 = instant)
+        """
+        self.path = path
+        self.speed = speed
+        self.responses = {}
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["key"]] = (record["body"], record.get("latency", 0.0))
+    
+    def _lookup(self, payload):
+        record = self.responses.get(request_key(payload))
+        if record is None:
+            return None, Response(404, None, f"No recorded response for this request in {self.path}")
+        body, latency = record
+        return latency * self.speed, Response(200, body, json.dumps(body, ensure_ascii=False))
+    
+    def post(self, session, base_url, api_key, payload):
+        delay, outcome = self._lookup(payload)
+        if delay:
+            time.sleep(delay)
+        return outcome
+    
+    async def apost(self, session, base_url, api_key, payload):
+        delay, outcome = self._lookup(payload)
+        if delay:
+            await asyncio.sleep(delay)
+        return outcome
+
+
+# Names generated by SyntheticBackend, found back in the prompts built from them
+_ENTITY_PATTERN = r"thực thể \d+(?: \(viết tắt\))?"
+_EVENT_PATTERN = _ENTITY_PATTERN + r" hoạt động \d+"
+
+
+class SyntheticBackend:
+    """
+    Answer every prompt of the pipeline with schema-valid synthetic JSON.
+    
+    Entities and events are drawn from a fixed vocabulary, so chunks share names
+    as in a real document and the standardization and inference stages get work
+    to do. Latency, rate limits (429) and overload errors (503) are injected
+    at configurable rates.
+    """
+    
+    def __init__(self, latency=0.0, latency_jitter=0.0, rate_limit_rate=0.0, server_error_rate=0.0,
+                 claims_per_chunk=8, events_per_claim=2, vocabulary=500, seed=0):
+        """
+        Initialize the backend.
+        
+        Args:
+            latency: Mean response time in seconds
+            latency_jitter: Maximum random deviation from the mean response time
+            rate_limit_rate: Fraction of requests answered with 429
+            server_error_rate: Fraction of requests answered with 503
+            claims_per_chunk: Number of claims extracted from every chunk
+            events_per_claim: Maximum number of events per claim
+            vocabulary: Number of distinct entity names
+            seed: Seed of the generated content and of the injected errors
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.claims_per_chunk = claims_per_chunk
+        self.events_per_claim = events_per_claim
+        self.vocabulary = vocabulary
+        self.seed = seed
+        self._faults = random.Random(seed)
+        self._lock = Lock()
+        self._generators = {
+            PREKG_ENTITY_RESOLUTION_SYSTEM_PROMPT: self._text,
+            CLAIM_EXTRACTION_SYSTEM_PROMPT: self._claims,
+            EVENT_IDENTIFICATION_SYSTEM_PROMPT: self._events,
+            EVENT_ATTRIBUTE_SYSTEM_PROMPT: self._event_attributes,
+            EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT: self._event_batch,
+            ENTITY_RESOLUTION_SYSTEM_PROMPT: self._entity_mapping,
+            EVENT_RESOLUTION_SYSTEM_PROMPT: self._event_mapping,
+        }
+    
+    def _entity(self, rng):
+        index = int(rng.paretovariate(1.2)) % self.vocabulary
+        # Some mentions are variants of the name, for the resolution stages to merge
+        return f"thực thể {index}" + (" (viết tắt)" if rng.random() < 0.1 else "")
+    
+    def _sentence(self, rng):
+        return f"{self._entity(rng)} liên quan đến {self._entity(rng)} vào năm {rng.randint(1900, 2000)}."
+    
+    def _text(self, rng, user_prompt):
+        return " ".join(self._sentence(rng) for _ in range(self.claims_per_chunk))
+    
+    def _claims(self, rng, user_prompt):
+        return "\n".join(self._sentence(rng) for _ in range(self.claims_per_chunk))
+    
+    def _event_list(self, rng, with_attributes):
+        events = []
+        for _ in range(rng.randint(1, self.events_per_claim)):
+            participants = sorted({self._entity(rng) for _ in range(rng.randint(1, 3))})
+            event = {
+                "description": f"{participants[0]} hoạt động {rng.randint(0, self.vocabulary * 4)}",
+                "participants": participants,
+            }
+            if with_attributes:
+                event["time"] = f"năm {rng.randint(1900, 2000)}" if rng.random() < 0.6 else None
+                event["location"] = f"địa điểm {rng.randint(0, self.vocabulary // 5)}" if rng.random() < 0.4 else None
+            events.append(event)
+        return events
+    
+    def _events(self, rng, user_prompt):
+        return json.dumps(self._event_list(rng, False), ensure_ascii=False)
+    
+    def _event_attributes(self, rng, user_prompt):
+        # Attribute the events listed in the prompt, copying them exactly
+        events = []
+        for match in re.finditer(r"^\d+\. description: '(.*)', participants: (\[.*\])$", user_prompt, re.MULTILINE):
+            try:
+                participants = ast.literal_eval(match.group(2))
+            except (ValueError, SyntaxError):
+                continue
+            events.append({
+                "description": match.group(1),
+                "participants": participants,
+                "time": f"năm {rng.randint(1900, 2000)}" if rng.random() < 0.6 else None,
+                "location": f"địa điểm {rng.randint(0, self.vocabulary // 5)}" if rng.random() < 0.4 else None,
+            })
+        return json.dumps(events, ensure_ascii=False)
+    
+    def _event_batch(self, rng, user_prompt):
+        claims = user_prompt.split("CÁC CÂU KHẲNG ĐỊNH:\n", 1)[-1].split("\n\n", 1)[0]
+        claim_count = len(re.findall(r"^\d+\. ", claims, re.MULTILINE))
+        return json.dumps([
+            {"claim_id": claim_id, "events": self._event_list(rng, True)}
+            for claim_id in range(1, claim_count + 1)
+        ], ensure_ascii=False)
+    
+    def _mapping(self, prefix, names):
+        # Merge abbreviated variants into their full name
+        mapping = {}
+        for name in sorted(set(names)):
+            if " (viết tắt)" in name:
+                mapping.setdefault(prefix + name.replace(" (viết tắt)", ""), []).append(prefix + name)
+        return json.dumps(mapping, ensure_ascii=False)
+    
+    def _entity_mapping(self, rng, user_prompt):
+        return self._mapping("ENTITY|", re.findall(_ENTITY_PATTERN, user_prompt))
+    
+    def _event_mapping(self, rng, user_prompt):
+        return self._mapping("EVENT|", re.findall(_EVENT_PATTERN, user_prompt))
+    
+    def _relations(self, rng, user_prompt):
+        # Relation and inference prompts: a few triples between the events of the
+        # prompt, or between its entities if there are no events
+        names = sorted({"EVENT|" + name for name in re.findall(_EVENT_PATTERN, user_prompt)})
+        if len(names) < 2:
+            names = sorted({"ENTITY|" + name for name in re.findall(_ENTITY_PATTERN, user_prompt)})
+        if len(names) < 2:
+            names = [f"ENTITY|thực thể {index}" for index in rng.sample(range(self.vocabulary), min(4, self.vocabulary))]
+        triples = []
+        if len(names) < 2:
+            return json.dumps(triples)
+        for _ in range(min(len(names), rng.randint(1, 5))):
+            subject, obj = rng.sample(names, 2)
+            triples.append({"subject": subject, "predicate": rng.choice(["PRECEDE", "CAUSE", "liên quan"]), "object": obj})
+        return json.dumps(triples, ensure_ascii=False)
+    
+    def _answer(self, payload):
+        """Get the injected failure or the synthetic answer of a request, and its latency."""
+        with self._lock:
+            draw = self._faults.random()
+            latency = max(0.0, self.latency + self._faults.uniform(-self.latency_jitter, self.latency_jitter))
+        
+        if draw < self.rate_limit_rate:
+            body = {"error": {"code": 429, "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}
+            ]}}
+            return latency, Response(429, body, json.dumps(body))
+        if draw < self.rate_limit_rate + self.server_error_rate:
+            return latency, Response(503, None, "Synthetic overload")
+        
+        messages = payload.get("messages", [])
+        system_prompt = messages[0]["content"] if len(messages) > 1 else None
+        user_prompt = "".join(part.get("text", "") for part in messages[-1]["content"])
+        
+        # Identical requests get identical answers, as with a deterministic model
+        rng = random.Random(f"{self.seed}:{request_key(payload)}")
+        generate = self._generators.get(system_prompt, self._relations)
+        return latency, _completion(generate(rng, user_prompt), payload)
+    
+    def post(self, session, base_url, api_key, payload):
+        latency, outcome = self._answer(payload)
+        if latency:
+            time.sleep(latency)
+        return outcome
+    
+    async def apost(self, session, base_url, api_key, payload):
+        latency, outcome = self._answer(payload)
+        if latency:
+            await asyncio.sleep(latency)
+        return outcome
+
+
+_backends = {}
+_backends_lock = Lock()
+
+
+def get_llm_backend(config):
+    """
+    Get the process-wide backend selected by [llm] backend.
+    
+    "http" (default) sends requests to base_url, "record" does the same and
+    records the responses to replay_path, "replay" serves them back from
+    replay_path and "synthetic" generates answers locally ([llm.synthetic]).
+    
+    Args:
+        config: Configuration dictionary
+    
+    Returns:
+        Backend instance shared by all LLM objects with the same settings
+    """
+    llm_config = config["llm"]
+    backend = llm_config.get("backend", "http")
+    replay_path = llm_config.get("replay_path", ".llm_cache/replay.jsonl")
+    
+    if backend == "synthetic":
+        synthetic_config = llm_config.get("synthetic", {})
+        cache_key = (backend, tuple(sorted(synthetic_config.items())))
+    elif backend == "replay":
+        cache_key = (backend, replay_path, llm_config.get("replay_speed", 0.0))
+    elif backend == "record":
+        cache_key = (backend, replay_path)
+    elif backend == "http":
+        cache_key = (backend,)
+    else:
+        raise ValueError(f"Unknown LLM backend: {backend!r} (expected 'http', 'record', 'replay' or 'synthetic')")
+    
+    with _backends_lock:
+        if cache_key not in _backends:
+            if backend == "synthetic":
+                _backends[cache_key] = SyntheticBackend(**synthetic_config)
+            elif backend == "replay":
+                _backends[cache_key] = ReplayBackend(replay_path, speed=llm_config.get("replay_speed", 0.0))
+            elif backend == "record":
+                _backends[cache_key] = RecordingBackend(replay_path)
+            else:
+                _backends[cache_key] = HTTPBackend()
+        return _backends[cache_key]
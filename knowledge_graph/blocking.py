@@ -0,0 +1,231 @@
+"""Candidate blocking for sharded LLM-based resolution.
+
+A single resolution prompt cannot hold every entity or event of a large
+document. Items are therefore grouped locally into blocks of likely duplicates
+(items sharing blocking keys such as words, character n-grams or attached
+nodes, weighted by how rare the keys are), the blocks are packed into shards of
+bounded size, every shard is resolved by its own LLM call, and the per-shard
+mappings are merged with union-find.
+"""
+import math
+from itertools import combinations
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tqdm.auto import tqdm
+from knowledge_graph.graph_utils import UnionFind
+from knowledge_graph.predicates import load_stopwords
+from knowledge_graph.metrics import bind_context
+
+
+def text_blocking_keys(text, ngram_size=3):
+    """
+    Get the blocking keys of a name: its non-stopword words and character n-grams.
+    
+    Args:
+        text: Entity or event name
+        ngram_size: Length of the character n-grams (0 = words only)
+    
+    Returns:
+        Set of (kind, value) keys
+    """
+    words = text.lower().split()
+    stopwords = load_stopwords()
+    keys = {("word", word) for word in words if word not in stopwords}
+    
+    if ngram_size > 0:
+        compact = "".join(words)
+        keys.update(("ngram", compact[i:i + ngram_size]) for i in range(len(compact) - ngram_size + 1))
+    return keys
+
+
+def _candidate_pairs(item_keys, max_key_frequency, top_k):
+    """
+    Score candidate duplicate pairs by the keys they share.
+    
+    Items sharing a key, or a pair of common keys, are candidates. Keys shared
+    by more than max_key_frequency items are too common to pair all their items:
+    they only pair each item with its top_k neighbours in the sorted list of the
+    key's items. Candidates are scored on all their shared keys, each weighted by its
+    IDF log(items / items with the key) so rare keys count most: the weighted
+    overlap (a name contained in the other scores high) plus the weighted
+    Jaccard similarity. Every item keeps its top_k best-scored candidates.
+    
+    Returns:
+        Dictionary mapping (item, item) pairs to their score
+    """
+    items_by_key = defaultdict(list)
+    for item in sorted(item_keys):
+        for key in item_keys[item]:
+            items_by_key[key].append(item)
+    
+    # Pairs of common keys are much rarer than each of them
+    blocks = dict(items_by_key)
+    if max_key_frequency:
+        common_keys_by_item = defaultdict(list)
+        for key, items in items_by_key.items():
+            if len(items) > max_key_frequency:
+                for item in items:
+                    common_keys_by_item[item].append(key)
+        for item in sorted(common_keys_by_item):
+            for key_pair in combinations(sorted(common_keys_by_item[item]), 2):
+                blocks.setdefault(key_pair, []).append(item)
+    
+    candidates = defaultdict(set)
+    for items in blocks.values():
+        if max_key_frequency and len(items) > max_key_frequency:
+            # Sorted neighbourhood: only items close in name order are paired
+            for i, item in enumerate(items):
+                candidates[item].update(items[max(0, i - top_k):i + top_k + 1])
+        elif len(items) > 1:
+            for item in items:
+                candidates[item].update(items)
+    
+    total = len(item_keys)
+    weights = {key: math.log(total / len(items)) + 1e-6 for key, items in items_by_key.items()}
+    item_weights = {item: sum(weights[key] for key in keys) for item, keys in item_keys.items()}
+    
+    pairs = {}
+    for item, others in candidates.items():
+        scores = []
+        for other in others:
+            if other == item:
+                continue
+            shared = sum(weights[key] for key in item_keys[item] & item_keys[other])
+            score = (
+                shared / min(item_weights[item], item_weights[other])
+                + shared / (item_weights[item] + item_weights[other] - shared)
+            )
+            scores.append((-score, other))
+        for rank, (negative_score, other) in enumerate(sorted(scores)[:top_k]):
+            pair = (min(item, other), max(item, other))
+            # Ranked by the best position of the pair in either item's candidates, then by score
+            pairs[pair] = min(pairs.get(pair, (rank, negative_score)), (rank, negative_score))
+    return pairs
+
+
+def plan_shards(item_keys, max_shard_size=40, max_key_frequency=50, top_k=5):
+    """
+    Group items into shards of candidate duplicates.
+    
+    Items are linked to their best candidates (see _candidate_pairs) and the
+    links are followed from the strongest to the weakest, merging blocks as long
+    as they fit in max_shard_size: oversized groups are split on their weakest
+    links. Small blocks are then packed together. Items that share no key with
+    any other item are left out, as there is nothing to merge.
+    
+    Args:
+        item_keys: Dictionary mapping each item to its set of blocking keys
+        max_shard_size: Maximum number of items per shard
+        max_key_frequency: Keys shared by more items only link close neighbours (0 = no limit)
+        top_k: Number of candidates kept per item
+    
+    Returns:
+        List of shards (sorted lists of items), in a deterministic order
+    """
+    pairs = _candidate_pairs(item_keys, max_key_frequency, top_k)
+    
+    components = UnionFind()
+    for (first, second), _ in sorted(pairs.items(), key=lambda pair: (pair[1], pair[0])):
+        first_root, second_root = components.find(first), components.find(second)
+        if first_root != second_root and components.size[first_root] + components.size[second_root] <= max_shard_size:
+            components.union(first_root, second_root)
+    
+    blocks = [sorted(component) for component in components.groups()]
+    blocks.sort(key=lambda block: (-len(block), block))
+    
+    # Pack blocks into shards
+    shards = []
+    current = []
+    for block in blocks:
+        if current and len(current) + len(block) > max_shard_size:
+            shards.append(current)
+            current = []
+        current = current + block
+    if current:
+        shards.append(current)
+    return [sorted(shard) for shard in shards if len(shard) > 1]
+
+
+def resolve_shards(shards, resolve_shard, max_workers=4, desc="Resolving shards"):
+    """
+    Resolve every shard with its own call, in parallel.
+    
+    Args:
+        shards: List of shards from plan_shards()
+        resolve_shard: Function taking a shard and returning a {standard: [variants]} mapping
+        max_workers: Number of shards resolved in parallel
+        desc: Progress bar description
+    
+    Returns:
+        List of mappings, one per shard
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(tqdm(executor.map(bind_context(resolve_shard), shards), total=len(shards), desc=desc))
+
+
+def normalize_mapping(mapping, prefix, lowercase=False):
+    """
+    Clean a {standard: [variants]} mapping returned by the LLM.
+    
+    Args:
+        mapping: Parsed LLM response
+        prefix: Node prefix such as "ENTITY|" the LLM may echo back
+        lowercase: Whether to lowercase the names
+        
+    Returns:
+        Mapping of cleaned names, or {} if the response is not a mapping
+    """
+    if not isinstance(mapping, dict):
+        return {}
+    
+    def clean(name):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+        name = name.strip()
+        return name.lower() if lowercase else name
+    
+    normalized = {}
+    for standard, variants in mapping.items():
+        if isinstance(variants, str):
+            variants = [variants]
+        elif not isinstance(variants, list):
+            continue
+        standard = clean(standard)
+        if standard:
+            normalized[standard] = [clean(variant) for variant in variants if isinstance(variant, str) and clean(variant)]
+    return normalized
+
+
+def merge_mappings(mappings, counts=None):
+    """
+    Merge per-shard {standard: [variants]} mappings through union-find.
+    
+    When shards disagree on the standard name of a merged group, the most
+    frequent standard wins, then the longest one.
+    
+    Args:
+        mappings: Iterable of mappings cleaned by normalize_mapping()
+        counts: Optional dictionary of item frequencies
+    
+    Returns:
+        Dictionary mapping every item of a merged group to its standard name
+    """
+    counts = counts or {}
+    groups = UnionFind()
+    standards = set()
+    for mapping in mappings:
+        for standard, variants in mapping.items():
+            standards.add(standard)
+            groups.add(standard)
+            for variant in variants:
+                groups.union(standard, variant)
+    
+    to_standard = {}
+    for group in groups.groups():
+        standard = min(
+            (item for item in group if item in standards),
+            key=lambda item: (-counts.get(item, 0), -len(item), item),
+        )
+        for item in group:
+            to_standard[item] = standard
+    return to_standard
@@ -0,0 +1,92 @@
+"""Append-only checkpoint of per-chunk extraction results."""
+import os
+import json
+import hashlib
+
+
+class ChunkCheckpoint:
+    """
+    Append-only JSONL store of extraction results keyed by chunk number.
+    
+    Every processed chunk appends one line {"chunk": i, "fingerprint": ..., "triples": [...]},
+    so the cost of saving a chunk only depends on the size of that chunk. When a
+    chunk appears several times (re-processed after a resume), the last line wins.
+    A truncated last line, left by a crash while writing, is ignored on load.
+    The fingerprint identifies the chunk text (and anything else the results depend
+    on), so results of a chunk that changed since they were saved are not reused.
+    """
+    
+    def __init__(self, path):
+        """
+        Initialize the checkpoint.
+        
+        Args:
+            path: Path of the JSONL checkpoint file
+        """
+        self.path = path
+        # Chunk numbers skipped by the last load() because their results are stale
+        self.stale_chunks = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    @staticmethod
+    def fingerprint(*parts):
+        """Hash the chunk text and the settings its results depend on."""
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    
+    def load(self, fingerprints=None):
+        """
+        Load the saved chunk results.
+        
+        Args:
+            fingerprints: Optional dictionary mapping chunk number to its current
+                fingerprint, results saved with another fingerprint are skipped
+        
+        Returns:
+            Dictionary mapping chunk number to its list of triples
+        """
+        chunks = {}
+        stale = set()
+        if not os.path.exists(self.path):
+            return chunks
+        
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️  Warning: Ignoring unreadable checkpoint line {line_number} in {self.path}")
+                    continue
+                if fingerprints is not None and record.get("fingerprint") != fingerprints.get(record["chunk"]):
+                    stale.add(record["chunk"])
+                    continue
+                chunks[record["chunk"]] = record["triples"]
+        
+        self.stale_chunks = stale - set(chunks)
+        if self.stale_chunks:
+            print(f"⚠️  Warning: {len(self.stale_chunks)} chunk(s) changed since they were saved in {self.path}, they will be processed again")
+        return chunks
+    
+    def append(self, chunk, triples, fingerprint=None):
+        """
+        Durably save the results of one chunk.
+        
+        Args:
+            chunk: Chunk number (1-based)
+            triples: List of triples extracted from the chunk
+            fingerprint: Fingerprint of the chunk (see fingerprint())
+        """
+        line = json.dumps({"chunk": chunk, "fingerprint": fingerprint, "triples": triples}, ensure_ascii=False)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+    
+    def reset(self):
+        """Remove all saved chunk results."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -3,6 +3,10 @@ import re
 import json
 from collections import defaultdict
 from knowledge_graph.llm import LLM, extract_json_from_text
+from knowledge_graph.graph_utils import connected_components
+from knowledge_graph.graph_core import NodeKind, TripleGraph
+from knowledge_graph.predicates import limit_predicate_length, normalize_predicates
+from knowledge_graph.blocking import text_blocking_keys, plan_shards, resolve_shards, merge_mappings, normalize_mapping
 
 from knowledge_graph.prompts import (
     ENTITY_RESOLUTION_SYSTEM_PROMPT, 
@@ -14,41 +18,14 @@ from knowledge_graph.prompts import (
 )
 
 
-def limit_predicate_length(predicate, max_words=6):
-    """
-    Enforce a maximum word limit on predicates.
-    
-    Args:
-        predicate: The original predicate string
-        max_words: Maximum number of words allowed (default: 3)
-        
-    Returns:
-        Shortened predicate with no more than max_words
-    """
-    words = predicate.split()
-    if len(words) <= max_words:
-        return predicate
-    
-    # If too long, use only the first max_words words
-    shortened = ' '.join(words[:max_words])
-    
-    # Remove trailing prepositions or articles if they're the last word
-    with open('vietnamese-stopwords.txt', 'r', encoding='utf-8') as file:
-        stop_words = file.read().splitlines()
-    
-    last_word = shortened.split()[-1].lower()
-    if last_word in stop_words and len(words) > 1:
-        shortened = ' '.join(shortened.split()[:-1])
-    
-    return shortened
-
-def standardize_entities(triples, config):
+def standardize_entities(triples, config, stream=None):
     """
     Standardize entity names across all triples.
     
     Args:
         triples: List of dictionaries with 'subject', 'predicate', and 'object' keys
         config: Configuration dictionary
+        stream: Optional TripleStream receiving the entity renames
         
     Returns:
         List of triples with standardized entity names
@@ -75,19 +52,17 @@ def standardize_entities(triples, config):
         print("Error: No valid triples found for entity standardization")
         return []
     
-    # 1. Extract all unique entities
-    def get_entity_content(entity):
-        if not entity or not entity.startswith("ENTITY|"):
-            return ""
-        return entity.split("|", 1)[-1].strip().lower()
-    
-    all_entities = set()
-    for triple in valid_triples:
-        subj, obj = get_entity_content(triple["subject"]), get_entity_content(triple["object"])
-        if subj:
-            all_entities.add(subj)
-        if obj:
-            all_entities.add(obj)
+    # 1. Extract all unique entities, normalizing each interned node once
+    graph = TripleGraph.from_triples(valid_triples)
+    counts = graph.occurrence_counts()
+    normalized = {}
+    entity_counts = defaultdict(int)
+    for node_id in graph.node_ids(NodeKind.ENTITY, counts):
+        content = graph.nodes.contents[node_id].strip().lower()
+        if content:
+            normalized[node_id] = content
+            entity_counts[content] += counts[node_id]
+    all_entities = set(entity_counts)
     
     # 2. Group similar entities - first by exact match after lowercasing and removing stopwords
     standardized_entities = {}
@@ -108,17 +83,8 @@ def standardize_entities(triples, config):
         else:
             # Multiple variants, choose the most common or the shortest one as standard
             # Sort by frequency in triples, then by length (shorter is better)
-            variant_counts = defaultdict(int)
-            for triple in valid_triples:
-                subj, obj = get_entity_content(triple["subject"]), get_entity_content(triple["object"])
-                for variant in variants:
-                    if subj and subj == variant:
-                        variant_counts[variant] += 1
-                    if obj and obj == variant:
-                        variant_counts[variant] += 1
-            
             # Choose the most common variant as the standard form
-            standard_form = sorted(variants, key=lambda x: (-variant_counts[x], len(x)))[0]
+            standard_form = sorted(variants, key=lambda x: (-entity_counts[x], len(x)))[0]
             for variant in variants:
                 standardized_entities[variant] = standard_form
     
@@ -131,13 +97,17 @@ def standardize_entities(triples, config):
     sorted_standards = sorted(standard_forms, key=len)
     
     # 5. Apply standardization to all triples
+    names = graph.nodes.names
+    final_names = {
+        node_id: "ENTITY|" + standardized_entities.get(content, content)
+        for node_id, content in normalized.items()
+    }
+    if stream is not None:
+        stream.rename_nodes("entity_standardization", {names[node_id]: name for node_id, name in final_names.items()})
     standardized_triples = []
-    for triple in valid_triples:
-        subj_lower = get_entity_content(triple["subject"])
-        obj_lower = get_entity_content(triple["object"])
-
-        final_subj = "ENTITY|" + standardized_entities.get(subj_lower, subj_lower) if subj_lower else triple["subject"]
-        final_obj = "ENTITY|" + standardized_entities.get(obj_lower, obj_lower) if obj_lower else triple["object"]
+    for triple, subject_id, object_id in zip(valid_triples, graph.subjects, graph.objects):
+        final_subj = final_names.get(subject_id, names[subject_id])
+        final_obj = final_names.get(object_id, names[object_id])
         
         standardized_triple = {
             "subject": final_subj,
@@ -150,7 +120,7 @@ def standardize_entities(triples, config):
     
     # 6. Optional: Use LLM to help with entity resolution for ambiguous cases
     if config.get("standardization", {}).get("use_llm_for_entities", False):
-        standardized_triples = _resolve_entities_with_llm(standardized_triples, config)
+        standardized_triples = _resolve_entities_with_llm(standardized_triples, config, stream)
     
     # 7. Filter out self-referencing triples
     filtered_triples = [triple for triple in standardized_triples if triple["subject"] != triple["object"]]
@@ -193,18 +163,16 @@ def infer_relationships(triples, config):
         print("Error: No valid triples found for relationship inference")
         return []
     
-    # Create a graph representation for easier traversal
-    graph = defaultdict(set)
-    all_entities = set()
-    for triple in valid_triples:
-        subj = triple["subject"]
-        obj = triple["object"]
-        graph[subj].add(obj)
-        all_entities.add(subj)
-        all_entities.add(obj)
+    # Create an interned graph representation for easier traversal
+    graph = TripleGraph.from_triples(valid_triples)
+    names = graph.nodes.names
+    all_entities = set(names)
     
     # Find disconnected communities
-    communities = _identify_communities(graph)
+    communities = [
+        {names[node_id] for node_id in community}
+        for community in _identify_communities(dict(enumerate(graph.successors())))
+    ]
     print(f"Identified {len(communities)} disconnected communities in the graph")
     
     new_triples = []
@@ -222,7 +190,7 @@ def infer_relationships(triples, config):
             new_triples.extend(within_community_triples)
     
     # Apply transitive inference rules
-    transitive_triples = _apply_transitive_inference(valid_triples, graph)
+    transitive_triples = _apply_transitive_inference(graph)
     if transitive_triples:
         new_triples.extend(transitive_triples)
     
@@ -238,9 +206,8 @@ def infer_relationships(triples, config):
     # De-duplicate triples
     unique_triples = _deduplicate_triples(valid_triples)
     
-    # Final pass: ensure all predicates follow the 3-word limit
-    for triple in unique_triples:
-        triple["predicate"] = limit_predicate_length(triple["predicate"])
+    # Final pass: ensure all predicates follow the word limit
+    normalize_predicates(unique_triples)
     
     # Filter out self-referencing triples
     filtered_triples = [triple for triple in unique_triples if triple["subject"] != triple["object"]]
@@ -260,60 +227,31 @@ def _identify_communities(graph):
     Returns:
         List of sets, where each set contains nodes in a community
     """
-    # Get all nodes
-    all_nodes = set(graph.keys()).union(*[graph[node] for node in graph])
-    
-    # Track visited nodes
-    visited = set()
-    communities = []
-    
-    # Depth-first search to find connected components
-    def dfs(node, community):
-        visited.add(node)
-        community.add(node)
-        
-        # Visit outgoing edges
-        for neighbor in graph.get(node, []):
-            if neighbor not in visited:
-                dfs(neighbor, community)
-        
-        # Visit incoming edges (we need to check all nodes)
-        for source, targets in graph.items():
-            if node in targets and source not in visited:
-                dfs(source, community)
-    
-    # Find all communities
-    for node in all_nodes:
-        if node not in visited:
-            community = set()
-            dfs(node, community)
-            communities.append(community)
-    
-    return communities
+    return connected_components(graph)
 
-def _apply_transitive_inference(triples, graph):
+def _apply_transitive_inference(graph):
     """
     Apply transitive inference to find new relationships.
     
     Args:
-        triples: List of triple dictionaries
-        graph: Dictionary representing the graph structure
+        graph: TripleGraph of the triples
         
     Returns:
         List of new inferred triples
     """
     new_triples = []
+    names = graph.nodes.names
+    successors = graph.successors()
     
-    # Predicates by subject-object pairs
+    # Predicates by subject-object ID pairs
     predicates = {}
-    for triple in triples:
-        key = (triple["subject"], triple["object"])
-        predicates[key] = triple["predicate"]
+    for subject_id, predicate, object_id, _ in graph.edges():
+        predicates[(subject_id, object_id)] = predicate
     
     # Find transitive relationships: A -> B -> C implies A -> C
-    for subj in graph:
-        for mid in graph[subj]:
-            for obj in graph.get(mid, []):
+    for subj, mids in enumerate(successors):
+        for mid in mids:
+            for obj in successors[mid]:
                 # Only consider paths where A->B->C and A!=C
                 if subj != obj and (subj, obj) not in predicates:
                     # Create a new predicate combining the two relationships
@@ -321,13 +259,13 @@ def _apply_transitive_inference(triples, graph):
                     pred2 = predicates.get((mid, obj), "liên quan")
                     
                     # Generate a new predicate based on the transitive relationship
-                    new_pred = f"gián tiếp {pred1}" if pred1 == pred2 else f"{pred1} thông qua {mid}"
+                    new_pred = f"gián tiếp {pred1}" if pred1 == pred2 else f"{pred1} thông qua {names[mid]}"
                     
                     # Add the new transitive relationship
                     new_triples.append({
-                        "subject": subj,
+                        "subject": names[subj],
                         "predicate": limit_predicate_length(new_pred),
-                        "object": obj,
+                        "object": names[obj],
                         "inferred": True  # Mark as inferred
                     })
     
@@ -354,90 +292,185 @@ def _deduplicate_triples(triples):
     
     return list(unique_triples.values())
 
-def _resolve_entities_with_llm(triples, config):
+def _resolve_entities_with_llm(triples, config, stream=None):
     """
     Use LLM to help resolve entity references and standardize entity names.
     
+    In "blocked" mode (the default) entities are grouped locally into shards of
+    candidate duplicates, every shard is resolved by its own LLM call in
+    parallel, and the mappings are merged. In "single" mode the 200 most
+    frequent entities are resolved in one call.
+    
     Args:
         triples: List of triples with potentially non-standardized entities
         config: Configuration dictionary
+        stream: Optional TripleStream receiving the entity renames
         
     Returns:
         List of triples with LLM-assisted entity standardization
     """
-    # Extract all unique entities
-    def get_entity_content(entity):
-        if not entity or not entity.startswith("ENTITY|"):
-            return ""
-        return entity.split("|", 1)[-1].strip().lower()
-    
-    all_entities = set()
-    for triple in triples:
-        subj, obj = get_entity_content(triple["subject"]), get_entity_content(triple["object"])
-        if subj:
-            all_entities.add(subj)
-        if obj:
-            all_entities.add(obj)
+    standardization_config = config.get("standardization", {})
     
-    # If there are too many entities, limit to the most frequent ones
+    # Extract all unique entities with how often they occur
+    graph = TripleGraph.from_triples(triples)
+    counts = graph.occurrence_counts()
+    normalized = {}
     entity_counts = defaultdict(int)
-    for triple in triples:
-        subj, obj = get_entity_content(triple["subject"]), get_entity_content(triple["object"])
-        if subj:
-            entity_counts[get_entity_content(triple["subject"])] += 1
-        if obj:
-            entity_counts[get_entity_content(triple["object"])] += 1
+    for node_id in graph.node_ids(NodeKind.ENTITY, counts):
+        content = graph.nodes.contents[node_id].strip().lower()
+        if content:
+            normalized[node_id] = content
+            entity_counts[content] += counts[node_id]
     
-    if len(all_entities) > 200:
+    if standardization_config.get("entity_resolution", "blocked") == "single":
         # Keep only the top 200 most frequent entities
-        all_entities = {entity for entity, count in sorted(entity_counts.items(), key=lambda x: -x[1])[:200]}
+        shards = [sorted(entity_counts, key=lambda x: (-entity_counts[x], x))[:200]]
+    else:
+        shards = _plan_entity_shards(graph, triples, normalized, standardization_config)
+        print(f"Split {len(entity_counts)} entities into {len(shards)} shards of candidate duplicates")
     
-    # Prepare triples context (limit to most relevant ones)
-    context_triples = sorted(triples, key=lambda t: entity_counts[t["subject"]], reverse=True)[:200]
-    triples_text = "\n".join([
-        f"- {t['subject']} {t['predicate']} {t['object']}"
-        for t in context_triples if t["object"] is not None
-    ])
+    if not shards or not shards[0]:
+        return triples
     
-    # Prepare prompt for LLM WITH CONTEXT
-    entity_list = "\n".join(sorted(all_entities))
+    llm = LLM(config)
+    entity_triples = _index_entity_triples(graph, triples, normalized)
     
-    try:
-        # Call LLM
-        llm = LLM(config)
-        response = llm(
-            ENTITY_RESOLUTION_SYSTEM_PROMPT,
-            get_entity_resolution_with_context_prompt(triples_text, entity_list)
-        )
+    def resolve_shard(shard):
+        # Prepare prompt for LLM WITH CONTEXT
+        triples_text = _get_shard_context(triples, entity_triples, entity_counts, shard)
+        entity_list = "\n".join(shard)
         
-        # Extract JSON mapping 
-        entity_mapping = extract_json_from_text(response)
-        print("Entity mapping from LLM:\n", "\n".join([f"- {k}: {v}" for k, v in entity_mapping.items()]))
+        try:
+            response = llm(
+                ENTITY_RESOLUTION_SYSTEM_PROMPT,
+                get_entity_resolution_with_context_prompt(triples_text, entity_list)
+            )
+            return normalize_mapping(extract_json_from_text(response), "ENTITY|", lowercase=True)
+        except Exception as e:
+            print(f"Error in LLM-based entity resolution: {e}")
+            return {}
+    
+    mappings = resolve_shards(
+        shards, resolve_shard,
+        max_workers=standardization_config.get("resolution_workers", 4),
+        desc="Entity resolution",
+    )
+    entity_to_standard = merge_mappings(mappings, entity_counts)
+    
+    if entity_to_standard:
+        groups = defaultdict(list)
+        for variant, standard in entity_to_standard.items():
+            if variant != standard:
+                groups[standard].append(variant)
+        print("Entity mapping from LLM:\n", "\n".join([f"- {k}: {v}" for k, v in groups.items()]))
         
-        if entity_mapping and isinstance(entity_mapping, dict):
-            # Apply the mapping to standardize entities
-            entity_to_standard = {}
-            for standard, variants in entity_mapping.items():
-                for variant in variants:
-                    entity_to_standard[variant] = standard
-                # Also map the standard form to itself
-                entity_to_standard[standard] = standard
-            
-            # Apply standardization to triples
-            for triple in triples:
-                subj, obj = get_entity_content(triple["subject"]), get_entity_content(triple["object"])
-                triple["subject"] = "ENTITY|" + entity_to_standard.get(subj, subj) if subj else triple["subject"]
-                triple["object"] = "ENTITY|" + entity_to_standard.get(obj, obj) if obj else triple["object"]
-                
-            print(f"Applied LLM-based entity standardization for {len(entity_mapping)} entity groups")
-        else:
-            print("Could not extract valid entity mapping from LLM response")
-    
-    except Exception as e:
-        print(f"Error in LLM-based entity resolution: {e}")
+        # Apply standardization to triples
+        renames = graph.rename_nodes({
+            node_id: "ENTITY|" + entity_to_standard.get(content, content)
+            for node_id, content in normalized.items()
+        })
+        graph.write_back(triples)
+        if stream is not None:
+            stream.rename_nodes("entity_standardization", renames)
+        
+        print(f"Applied LLM-based entity standardization for {len(groups)} entity groups")
+    else:
+        print("Could not extract valid entity mapping from LLM response")
     
     return triples
 
+def _plan_entity_shards(graph, triples, normalized, standardization_config):
+    """
+    Group entities into shards of candidate duplicates.
+    
+    Entities are candidates when they share a word or character n-gram, or
+    (optionally) appear in the same chunk, which lets abbreviations meet the
+    names they stand for. Only entities of a few chunks get chunk keys: common
+    entities would join the shards of every chunk into one.
+    
+    Args:
+        graph: TripleGraph of the triples
+        triples: List of triple dictionaries the graph was built from
+        normalized: Dictionary mapping entity node IDs to their normalized names
+        standardization_config: The [standardization] configuration section
+        
+    Returns:
+        List of shards (lists of normalized entity names)
+    """
+    ngram_size = standardization_config.get("resolution_ngram_size", 3)
+    entity_keys = {}
+    for content in normalized.values():
+        if content not in entity_keys:
+            entity_keys[content] = text_blocking_keys(content, ngram_size)
+    
+    if standardization_config.get("resolution_block_by_chunk", False):
+        entity_chunks = {}
+        for triple, subject_id, object_id in zip(triples, graph.subjects, graph.objects):
+            chunk = triple.get("chunk")
+            if chunk is None:
+                continue
+            for node_id in (subject_id, object_id):
+                if node_id in normalized:
+                    entity_chunks.setdefault(normalized[node_id], set()).add(str(chunk))
+        
+        max_chunks = standardization_config.get("resolution_chunk_key_max_chunks", 3)
+        for content, chunks in entity_chunks.items():
+            if len(chunks) <= max_chunks:
+                entity_keys[content].update(("chunk", chunk) for chunk in chunks)
+    
+    return plan_shards(
+        entity_keys,
+        max_shard_size=standardization_config.get("resolution_shard_size", 40),
+        max_key_frequency=standardization_config.get("resolution_max_key_frequency", 50),
+        top_k=standardization_config.get("resolution_candidates", 5),
+    )
+
+def _index_entity_triples(graph, triples, normalized):
+    """
+    Index the triples by the entities they mention, built once for all shards.
+    
+    Args:
+        graph: TripleGraph of the triples
+        triples: List of triple dictionaries the graph was built from
+        normalized: Dictionary mapping entity node IDs to their normalized names
+    
+    Returns:
+        Dictionary mapping normalized entity names to triple indices (once per mention)
+    """
+    entity_triples = defaultdict(list)
+    for i, (subject_id, object_id) in enumerate(zip(graph.subjects, graph.objects)):
+        if triples[i]["object"] is None:
+            continue
+        for node_id in (subject_id, object_id):
+            if node_id in normalized:
+                entity_triples[normalized[node_id]].append(i)
+    return entity_triples
+
+def _get_shard_context(triples, entity_triples, entity_counts, shard, limit=200):
+    """
+    Format the triples that mention the entities of a shard, most relevant first.
+    
+    Args:
+        triples: List of triple dictionaries
+        entity_triples: Index of the triples by entity, from _index_entity_triples()
+        entity_counts: Dictionary of entity frequencies
+        shard: List of normalized entity names
+        limit: Maximum number of triples
+        
+    Returns:
+        Triples formatted one per line
+    """
+    # A triple is as relevant as the shard entities it mentions are frequent
+    scores = defaultdict(int)
+    for content in set(shard):
+        for i in entity_triples.get(content, ()):
+            scores[i] += entity_counts[content]
+    
+    return "\n".join([
+        f"- {triples[i]['subject']} {triples[i]['predicate']} {triples[i]['object']}"
+        for _, i in sorted((-score, i) for i, score in scores.items())[:limit]
+    ])
+
 def _infer_relationships_with_llm(triples, communities, config):
     """
     Use LLM to infer relationships between disconnected communities.
@@ -4,7 +4,13 @@ from pprint import pprint
 from tqdm.auto import tqdm
 from functools import reduce
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from knowledge_graph.llm import LLM, extract_json_from_text
+from knowledge_graph.text_utils import estimate_tokens
+from knowledge_graph.graph_utils import connected_components
+from knowledge_graph.graph_core import NodeKind, TripleGraph
+from knowledge_graph.blocking import text_blocking_keys, plan_shards, resolve_shards, merge_mappings, normalize_mapping
+from knowledge_graph.metrics import span, bind_context
 
 from knowledge_graph.event_prompts import (
     # Event identification
@@ -13,6 +19,9 @@ from knowledge_graph.event_prompts import (
     # Event attributes
     EVENT_ATTRIBUTE_SYSTEM_PROMPT,
     get_event_attribute_user_prompt,
+    # Batched event identification with attributes
+    EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT,
+    get_event_extraction_batch_user_prompt,
     # Within-chunk event relations
     WITHIN_CHUNK_EVENT_RELATION_SYSTEM_PROMPT,
     get_within_chunk_event_relation_user_prompt,
@@ -59,35 +68,178 @@ def event2triplets(event):
     return participant_triplets + time_triplet + location_triplet
 
 
-def get_events_from_claims(claims, config, verbose=False):
-    output_events = []
-    llm = LLM(config)
+def get_events_from_single_claim(llm, claim, claims, verbose=False):
+    if verbose:
+        print(f"Processing claim: {claim}")
     
-    for claim in tqdm(claims, desc="Events from Claims"):
-        if verbose:
-            print(f"Processing claim: {claim}")
-        
+    with span("event_identification"):
         text_events = llm(EVENT_IDENTIFICATION_SYSTEM_PROMPT, get_event_identification_user_prompt(claim, claims))
-        events = extract_json_from_text(text_events, verbose=False)
-        
-        if verbose:
-            print("="*50)
-            pprint(text_events)
+    events = extract_json_from_text(text_events, verbose=False)
+    
+    if verbose:
+        print("="*50)
+        pprint(text_events)
 
+    with span("event_attributes"):
         text_attr_events = llm(EVENT_ATTRIBUTE_SYSTEM_PROMPT, get_event_attribute_user_prompt(events, claim, claims))
-        attr_events = extract_json_from_text(text_attr_events, verbose)
-        
-        if verbose:
-            print("="*50)
-            pprint(text_attr_events)
+    attr_events = extract_json_from_text(text_attr_events, verbose)
+    
+    if verbose:
+        print("="*50)
+        pprint(text_attr_events)
+    
+    def accumulate_triplets(acc, event):
+        triplets = event2triplets(event)
+        for triplet in triplets:
+            triplet["claim"] = claim
+        return acc + triplets
+    return reduce(accumulate_triplets, attr_events, [])
+
+
+def get_events_from_claim_batch(llm, batch, claims, verbose=False):
+    """
+    Identify events and their time/location for several claims in one request.
+    
+    Returns:
+        List with one list of triplets per claim of the batch, in batch order
+    """
+    if verbose:
+        print(f"Processing {len(batch)} claims in one request")
+    
+    with span("event_batch"):
+        text_events = llm(EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT, get_event_extraction_batch_user_prompt(batch, claims))
+    claim_events = extract_json_from_text(text_events, verbose)
+    
+    if verbose:
+        print("="*50)
+        pprint(text_events)
+    
+    if not isinstance(claim_events, list):
+        # Fall back to one identification and one attribute request per claim
+        print(f"⚠️  Could not parse batched events, extracting {len(batch)} claims separately")
+        return [get_events_from_single_claim(llm, claim, claims, verbose) for claim in batch]
+    
+    batch_triplets = [[] for _ in batch]
+    for item in claim_events:
+        if not isinstance(item, dict):
+            continue
+        claim_id = item.get("claim_id")
+        if not isinstance(claim_id, int) or not 1 <= claim_id <= len(batch):
+            continue
         
-        def accumulate_triplets(acc, event):
-            triplets = event2triplets(event)
-            for triplet in triplets:
+        claim = batch[claim_id - 1]
+        for event in item.get("events") or []:
+            if not isinstance(event, dict) or "description" not in event or "participants" not in event:
+                continue
+            for triplet in event2triplets(event):
                 triplet["claim"] = claim
-            return acc + triplets
-        output_events += reduce(accumulate_triplets, attr_events, [])
-    return output_events
+                batch_triplets[claim_id - 1].append(triplet)
+    return batch_triplets
+
+
+def _claim_bigrams(claim):
+    words = claim.lower().split()
+    return {(a, b) for a, b in zip(words, words[1:])}
+
+
+def select_context_claims(target_indices, claims, config):
+    """
+    Select the claims sent as context when extracting events from the target claims.
+    
+    Strategies ([extraction] context_window):
+        "all": every claim of the chunk
+        "neighbors": the target claims and context_neighbors claims on each side
+        "entities": claims sharing a word pair (likely an entity name) with a target claim
+    
+    Args:
+        target_indices: Indices of the claims being processed
+        claims: All claims of the chunk
+        config: Configuration dictionary
+        
+    Returns:
+        List of context claims in chunk order
+    """
+    extraction_config = config.get("extraction", {})
+    strategy = extraction_config.get("context_window", "all")
+    
+    if strategy == "neighbors":
+        k = extraction_config.get("context_neighbors", 3)
+        start = max(0, min(target_indices) - k)
+        end = min(len(claims), max(target_indices) + k + 1)
+        return claims[start:end]
+    
+    if strategy == "entities":
+        claim_bigrams = [_claim_bigrams(claim) for claim in claims]
+        
+        # Word pairs used by most claims ("của các", ...) do not identify an entity
+        bigram_counts = defaultdict(int)
+        for bigrams in claim_bigrams:
+            for bigram in bigrams:
+                bigram_counts[bigram] += 1
+        max_count = max(2, len(claims) // 2)
+        
+        target_bigrams = set()
+        for i in target_indices:
+            target_bigrams |= {b for b in claim_bigrams[i] if bigram_counts[b] <= max_count}
+        
+        targets = set(target_indices)
+        return [
+            claim for i, claim in enumerate(claims)
+            if i in targets or claim_bigrams[i] & target_bigrams
+        ]
+    
+    return claims
+
+
+def get_events_from_claims(claims, config, verbose=False):
+    llm = LLM(config)
+    workers = config.get("concurrency", {}).get("claim_workers", 1)
+    extraction_config = config.get("extraction", {})
+    
+    if extraction_config.get("mode", "separate") == "combined":
+        # One request identifies the events and attributes of a whole batch of claims
+        batch_size = max(1, extraction_config.get("claims_per_batch", 5))
+        units = [list(range(i, min(i + batch_size, len(claims)))) for i in range(0, len(claims), batch_size)]
+        prompts_per_unit = 1
+    else:
+        units = [[i] for i in range(len(claims))]
+        prompts_per_unit = 2
+    
+    contexts = [select_context_claims(unit, claims, config) for unit in units]
+    
+    def extract_unit(unit, context):
+        batch = [claims[i] for i in unit]
+        if prompts_per_unit == 1:
+            return get_events_from_claim_batch(llm, batch, context, verbose)
+        return [get_events_from_single_claim(llm, batch[0], context, verbose)]
+    
+    if workers <= 1 or len(units) <= 1:
+        unit_triplets = [
+            extract_unit(unit, context)
+            for unit, context in tqdm(zip(units, contexts), total=len(units), desc="Events from Claims")
+        ]
+    else:
+        # Units are independent, map() keeps the results in claim order
+        with ThreadPoolExecutor(max_workers=min(workers, len(units))) as executor:
+            unit_triplets = list(tqdm(
+                executor.map(bind_context(extract_unit), units, contexts),
+                total=len(units),
+                desc="Events from Claims",
+            ))
+    
+    # Report the context tokens saved compared to sending every claim with every prompt
+    full_tokens = estimate_tokens("\n".join(claims)) * len(units) * prompts_per_unit
+    sent_tokens = sum(estimate_tokens("\n".join(context)) for context in contexts) * prompts_per_unit
+    if full_tokens > sent_tokens:
+        print(f"✂️  Context windowing saved ~{full_tokens - sent_tokens} input tokens in this chunk "
+              f"({100 * (full_tokens - sent_tokens) / full_tokens:.0f}% of the claim context)")
+    
+    return [
+        triplet
+        for claim_triplets in unit_triplets
+        for triplets in claim_triplets
+        for triplet in triplets
+    ]
 
 
 def infer_within_chunk_event_relations(event_triples, config, verbose=False):
@@ -99,78 +251,124 @@ def infer_within_chunk_event_relations(event_triples, config, verbose=False):
     return extract_json_from_text(within_chunk_relations, verbose)
 
 
-def resolve_events_with_llm(triples, config, verbose=False):
-    def get_event_content(event):
-        if not event or not event.startswith("EVENT"):
-            return ""
-        return event.split("|")[1]
+def _plan_event_shards(graph, event_ids, standardization_config):
+    # Events are candidate duplicates when they share a time, a location or a participant,
+    # or words of their names (for events without attachments or with only common ones)
+    kinds, contents = graph.nodes.kinds, graph.nodes.contents
+    ngram_size = standardization_config.get("resolution_ngram_size", 3)
+    event_keys = {contents[node_id]: set(text_blocking_keys(contents[node_id], ngram_size)) for node_id in event_ids}
+    attachment_keys = {NodeKind.TIME: "time", NodeKind.LOCATION: "location", NodeKind.ENTITY: "participant"}
+    for subject_id, object_id in zip(graph.subjects, graph.objects):
+        for event_id, other_id in ((subject_id, object_id), (object_id, subject_id)):
+            key_kind = attachment_keys.get(kinds[other_id])
+            if kinds[event_id] == NodeKind.EVENT and contents[event_id] and key_kind:
+                event_keys[contents[event_id]].add((key_kind, contents[other_id].strip().lower()))
+
+    return plan_shards(
+        event_keys,
+        max_shard_size=standardization_config.get("resolution_shard_size", 40),
+        max_key_frequency=standardization_config.get("resolution_max_key_frequency", 50),
+        top_k=standardization_config.get("resolution_candidates", 5),
+    )
 
-    # Extract all unique events
-    all_events = set()
-    for triple in triples:
-        if get_event_content(triple["subject"]):
-            all_events.add(get_event_content(triple["subject"]))
-        if get_event_content(triple["object"]):
-            all_events.add(get_event_content(triple["object"]))
 
-    # If there are too many events, limit to the most frequent ones
-    event_counts = defaultdict(int)
-    for triple in triples:
-        if get_event_content(triple["subject"]):
-            event_counts[get_event_content(triple["subject"])] += 1
-        if get_event_content(triple["object"]):
-            event_counts[get_event_content(triple["object"])] += 1
-    if len(all_events) > 100:
-        # Keep only the top 100 most frequent events
-        all_events = {event for event, count in sorted(event_counts.items(), key=lambda x: -x[1])[:100]}
+def _index_event_triples(graph, triples):
+    # Triples mentioning every event, built once for all shards (an index per mention)
+    kinds, contents = graph.nodes.kinds, graph.nodes.contents
+    event_triples = defaultdict(list)
+    for i, (subject_id, object_id) in enumerate(zip(graph.subjects, graph.objects)):
+        if not (triples[i]["subject"] and triples[i]["object"]):
+            continue
+        for node_id in (subject_id, object_id):
+            if kinds[node_id] == NodeKind.EVENT:
+                event_triples[contents[node_id]].append(i)
+    return event_triples
+
+
+def _get_event_shard_context(triples, event_triples, event_counts, shard, limit=200):
+    # Triples that mention the shard's events, those with the most frequent events first
+    scores = defaultdict(int)
+    for event in set(shard):
+        for i in event_triples.get(event, ()):
+            scores[i] += event_counts[event]
 
-    # Prepare triples context (limit to most relevant ones)
-    context_triples = sorted(triples, key=lambda t: event_counts[t["subject"]], reverse=True)[:200]
     def get_event_claim(triplet):
         claim = triplet.get("claim", "")
         return f"(từ nhận định: {claim})" if claim else claim
     
-    triple_texts = "\n".join([
+    return "\n".join([
         f"- {t['subject']} {t['predicate']} {t['object']} {get_event_claim(t)}"
-        for t in context_triples if t["subject"] and t["object"]
+        for t in (triples[i] for _, i in sorted((-score, i) for i, score in scores.items())[:limit])
     ])
-    event_texts = "\n".join(sorted(all_events))
-
-    try:
-        # Call LLM to get event resolution mapping
-        llm = LLM(config)
-        response = llm(
-            EVENT_RESOLUTION_SYSTEM_PROMPT,
-            get_event_resolution_user_prompt(triple_texts, event_texts),
-        )
-        event_mapping = extract_json_from_text(response)
-        print("Event mapping from LLM:")
-        for standard, variants in event_mapping.items():
-            print(f"- '{standard}': {variants}")
 
-        if event_mapping and isinstance(event_mapping, dict):
-            # Apply the mapping to standardize events
-            event_to_standard = {}
-            for standard, variants in event_mapping.items():
-                for variant in variants:
-                    event_to_standard[variant] = standard
-                # Also map the standard form to itself
-                event_to_standard[standard] = standard
 
-            # Apply standardization to triples
-            for triple in triples:
-                subj_content, obj_content = get_event_content(triple["subject"]), get_event_content(triple["object"])
-                if subj_content:
-                    triple["subject"] = "EVENT|" + event_to_standard.get(subj_content, subj_content)
-                if obj_content:
-                    triple["object"] = "EVENT|" + event_to_standard.get(obj_content, obj_content)
+def resolve_events_with_llm(triples, config, verbose=False, stream=None):
+    standardization_config = config.get("standardization", {})
+    graph = TripleGraph.from_triples(triples)
+    contents = graph.nodes.contents
+
+    # Extract all unique events with how often they occur
+    counts = graph.occurrence_counts()
+    event_ids = [node_id for node_id in graph.node_ids(NodeKind.EVENT, counts) if contents[node_id]]
+    event_counts = {contents[node_id]: counts[node_id] for node_id in event_ids}
 
-            print(f"Applied LLM-based event standardization for {len(event_mapping)} event groups")
-        else:
-            print("Could not extract valid event mapping from LLM response")
+    if standardization_config.get("event_resolution", "blocked") == "single":
+        # Keep only the top 100 most frequent events
+        shards = [sorted(event_counts, key=lambda x: (-event_counts[x], x))[:100]]
+    else:
+        # Bucket candidate duplicates locally and resolve every bucket separately
+        shards = _plan_event_shards(graph, event_ids, standardization_config)
+        print(f"Split {len(event_counts)} events into {len(shards)} shards of candidate duplicates")
 
-    except Exception as e:
-        print(f"Error in LLM-based event resolution: {e}")
+    if not shards or not shards[0]:
+        return triples
+
+    llm = LLM(config)
+    event_triples = _index_event_triples(graph, triples)
+
+    def resolve_shard(shard):
+        triple_texts = _get_event_shard_context(triples, event_triples, event_counts, shard)
+        event_texts = "\n".join(shard)
+
+        try:
+            # Call LLM to get event resolution mapping
+            response = llm(
+                EVENT_RESOLUTION_SYSTEM_PROMPT,
+                get_event_resolution_user_prompt(triple_texts, event_texts),
+            )
+            return normalize_mapping(extract_json_from_text(response), "EVENT|")
+        except Exception as e:
+            print(f"Error in LLM-based event resolution: {e}")
+            return {}
+
+    mappings = resolve_shards(
+        shards, resolve_shard,
+        max_workers=standardization_config.get("resolution_workers", 4),
+        desc="Event resolution",
+    )
+    event_to_standard = merge_mappings(mappings, event_counts)
+
+    if event_to_standard:
+        groups = defaultdict(list)
+        for variant, standard in event_to_standard.items():
+            if variant != standard:
+                groups[standard].append(variant)
+        print("Event mapping from LLM:")
+        for standard, variants in groups.items():
+            print(f"- '{standard}': {variants}")
+
+        # Apply standardization to triples
+        renames = graph.rename_nodes({
+            node_id: "EVENT|" + event_to_standard.get(contents[node_id], contents[node_id])
+            for node_id in event_ids
+        })
+        graph.write_back(triples)
+        if stream is not None:
+            stream.rename_nodes("event_standardization", renames)
+
+        print(f"Applied LLM-based event standardization for {len(groups)} event groups")
+    else:
+        print("Could not extract valid event mapping from LLM response")
 
     return triples
 
@@ -190,36 +388,8 @@ def build_event_graph(event_triples):
 
 
 def identify_event_communities(event_graph):
-    # Get all nodes
-    all_nodes = set(event_graph.keys()).union(*[event_graph[node] for node in event_graph])
-
-    # Track visited nodes
-    visited = set()
-    communities = []
-
-    # Depth-first search to find connected components
-    def dfs(node, community):
-        visited.add(node)
-        community.add(node)
-
-        # Visit outgoing edges
-        for neighbor in event_graph.get(node, []):
-            if neighbor not in visited:
-                dfs(neighbor, community)
-
-        # Visit incoming edges (we need to check all nodes)
-        for source, targets in event_graph.items():
-            if node in targets and source not in visited:
-                dfs(source, community)
-
-    # Find all communities
-    for node in all_nodes:
-        if node not in visited:
-            community = set()
-            dfs(node, community)
-            communities.append(community)
-
-    return communities
+    # Weakly connected components of the event graph
+    return connected_components(event_graph)
 
 
 def infer_within_event_community_relations(triples, communities, config, verbose=False):
@@ -426,25 +596,28 @@ def infer_event_relationships(triples, config, verbose=False):
 
 
 def get_event_stats(event_triples):
-    nodes = [t["subject"] for t in event_triples] + [t["object"] for t in event_triples]
-    nodes = list(set(nodes))
-    events = list(set([n for n in nodes if n.startswith("EVENT")]))
-    participants = list(set([n for n in nodes if n.startswith("ENTITY")]))
-    locations = list(set([n for n in nodes if n.startswith("LOCATION")]))
-    times = list(set([n for n in nodes if n.startswith("TIME")]))
+    graph = TripleGraph.from_triples(event_triples)
+    kinds = graph.nodes.kinds
+    kind_counts = defaultdict(int)
+    for node_id in graph.node_ids():
+        kind_counts[kinds[node_id]] += 1
+    predicate_counts = graph.predicate_counts()
     
     return {
-        "events": len(events),
-        "participants": len(participants),
-        "locations": len(locations),
-        "times": len(times),
-        "relations": len([e for e in event_triples if e["subject"].startswith("EVENT") or e["object"].startswith("EVENT")]),
-        "has_participant": len([e for e in event_triples if e["predicate"] == "HAS_PARTICIPANT"]),
-        "at_location": len([e for e in event_triples if e["predicate"] == "AT_LOCATION"]),
-        "at_time": len([e for e in event_triples if e["predicate"] == "AT_TIME"]),
-        "precede": len([e for e in event_triples if e["predicate"] == "PRECEDE"]),
-        "co_occur": len([e for e in event_triples if e["predicate"] == "CO_OCCUR"]),
-        "cause": len([e for e in event_triples if e["predicate"] == "CAUSE"]),
+        "events": kind_counts[NodeKind.EVENT],
+        "participants": kind_counts[NodeKind.ENTITY],
+        "locations": kind_counts[NodeKind.LOCATION],
+        "times": kind_counts[NodeKind.TIME],
+        "relations": sum(
+            1 for subject_id, object_id in zip(graph.subjects, graph.objects)
+            if kinds[subject_id] == NodeKind.EVENT or kinds[object_id] == NodeKind.EVENT
+        ),
+        "has_participant": predicate_counts.get("HAS_PARTICIPANT", 0),
+        "at_location": predicate_counts.get("AT_LOCATION", 0),
+        "at_time": predicate_counts.get("AT_TIME", 0),
+        "precede": predicate_counts.get("PRECEDE", 0),
+        "co_occur": predicate_counts.get("CO_OCCUR", 0),
+        "cause": predicate_counts.get("CAUSE", 0),
     }
 
 
@@ -220,6 +220,97 @@ Bắt đầu đưa ra đáp án:
 """
 
 
+# ==================== BATCHED EVENT EXTRACTION ====================
+
+# Identification and attribute extraction in a single request for several claims.
+# The event and entity rules are shared with EVENT_IDENTIFICATION_SYSTEM_PROMPT.
+EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT = EVENT_IDENTIFICATION_SYSTEM_PROMPT.split("QUY ĐỊNH ĐẦU RA:")[0] + """\
+THUỘC TÍNH THỜI GIAN VÀ ĐỊA ĐIỂM CỦA SỰ KIỆN:
+Sau khi xác định sự kiện, trích xuất THỜI GIAN (time) và ĐỊA ĐIỂM (location) của MỖI sự kiện.
+1. THỜI GIAN: thời điểm cụ thể ("năm 1911"), khoảng thời gian ("từ 2010 đến 2015"), thời gian tương đối ("sau khi chiến tranh kết thúc"), giai đoạn/thời kỳ ("thời phong kiến").
+2. ĐỊA ĐIỂM: địa danh cụ thể ("cảng nhà rồng"), vị trí tương đối ("trước nhà"), khu vực/vùng ("miền bắc việt nam"), cơ sở vật lý ("trong bệnh viện chợ rẫy").
+3. CHỈ trích xuất thông tin CÓ MẶT trong câu khẳng định hoặc ngữ cảnh, liên quan TRỰC TIẾP đến sự kiện. TUYỆT ĐỐI không suy diễn.
+4. Nếu câu khẳng định có thời gian/địa điểm chung (ví dụ: "Năm 1955, A làm B ở Sài Gòn."), áp dụng cho TẤT CẢ sự kiện của câu đó.
+5. Toàn bộ time và location phải được viết thường. Nếu không tìm thấy, BẮT BUỘC trả về `null`.
+
+
+QUY ĐỊNH ĐẦU RA:
+1. Xử lý TỪNG câu khẳng định được đánh số một cách ĐỘC LẬP. Sự kiện của câu nào chỉ được đưa vào phần tử của câu đó.
+2. Đầu ra phải là một mảng JSON, mỗi phần tử ứng với một câu khẳng định, theo đúng thứ tự đánh số:
+[
+    {
+        "claim_id": <số thứ tự câu khẳng định>,
+        "events": [
+            {
+                "description": "<mô tả sự kiện>",
+                "participants": ["<entity 1>", "<entity 2>", ...],
+                "time": "<thời gian>" hoặc null,
+                "location": "<địa điểm>" hoặc null
+            },
+            ...
+        ]
+    },
+    ...
+]
+3. Ngoài cấu trúc JSON trên, TUYỆT ĐỐI KHÔNG viết thêm bất kỳ giải thích, suy luận, nhận xét, hay ký hiệu nào khác.
+"""
+
+def get_event_extraction_batch_user_prompt(claims, context):
+    claims_text = "\n".join([f"{i + 1}. {claim}" for i, claim in enumerate(claims)])
+    context_text = "\n".join(context)
+    
+    return f"""\
+NHIỆM VỤ: Xác định TẤT CẢ sự kiện cùng THỜI GIAN và ĐỊA ĐIỂM của chúng trong TỪNG câu khẳng định dưới đây.
+Bạn cần SUY NGHĨ thật kỹ càng theo từng bước và phân tích từng câu khẳng định cùng ngữ cảnh để đưa ra đáp án chính xác nhất.
+
+CÁC CÂU KHẲNG ĐỊNH:
+{claims_text}
+
+ĐỂ TRỢ GIÚP VIỆC XÁC ĐỊNH ĐÚNG THỰC THỂ, NGỮ CẢNH CỦA CÁC CÂU KHẲNG ĐỊNH LÀ:
+{context_text}
+
+
+VÍ DỤ:
+Các câu:
+1. "Năm 1955, Ngô Đình Diệm đã gian lận để chiến thắng trong Cuộc trưng cầu dân ý miền Nam Việt Nam."
+2. "Những xáo trộn chính trị vào cuối thập niên 1950 tạo nên sự bất ổn lớn trong xã hội miền Nam Việt Nam."
+Đầu ra:
+[
+    {{
+        "claim_id": 1,
+        "events": [
+            {{
+                "description": "ngô đình diệm chiến thắng trong cuộc trưng cầu dân ý miền nam việt nam",
+                "participants": ["ngô đình diệm", "cuộc trưng cầu dân ý", "miền nam việt nam"],
+                "time": "năm 1955",
+                "location": null
+            }},
+            {{
+                "description": "ngô đình diệm gian lận trong cuộc trưng cầu dân ý miền nam việt nam",
+                "participants": ["ngô đình diệm", "cuộc trưng cầu dân ý", "miền nam việt nam"],
+                "time": "năm 1955",
+                "location": null
+            }}
+        ]
+    }},
+    {{
+        "claim_id": 2,
+        "events": [
+            {{
+                "description": "xáo trộn chính trị tạo nên sự bất ổn lớn trong xã hội miền nam việt nam",
+                "participants": ["xáo trộn chính trị", "sự bất ổn lớn", "xã hội miền nam việt nam"],
+                "time": "cuối thập niên 1950",
+                "location": null
+            }}
+        ]
+    }}
+]
+
+Ngoài cấu trúc JSON, TUYỆT ĐỐI KHÔNG viết thêm bất kỳ giải thích, suy luận, nhận xét, hay ký hiệu nào khác.
+Bây giờ hãy xác định sự kiện:
+"""
+
+
 # ==================== WITHIN-CHUNK EVENT RELATIONS ====================
 
 WITHIN_CHUNK_EVENT_RELATION_SYSTEM_PROMPT = """\
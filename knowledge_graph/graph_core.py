@@ -0,0 +1,258 @@
+"""Compact interned representation of the triple list.
+
+The pipeline passes triples around as dictionaries of full node names such as
+"EVENT|..." or "ENTITY|...". TripleGraph interns every node name once, records
+its kind and content, and stores edges as integer IDs in arrays, so stages can
+count, group and rename nodes without re-parsing and re-hashing long strings.
+Use TripleGraph.from_triples() and to_triples() / write_back() to convert at
+the boundary of a stage.
+"""
+from array import array
+from enum import IntEnum
+
+
+class NodeKind(IntEnum):
+    """Kind of a node, given by the prefix of its name."""
+    OTHER = 0
+    EVENT = 1
+    ENTITY = 2
+    TIME = 3
+    LOCATION = 4
+
+
+_KIND_PREFIXES = {
+    "EVENT": NodeKind.EVENT,
+    "ENTITY": NodeKind.ENTITY,
+    "TIME": NodeKind.TIME,
+    "LOCATION": NodeKind.LOCATION,
+}
+
+# Marks triple fields that are absent (as opposed to None)
+_MISSING = object()
+
+
+def parse_node(name):
+    """
+    Split a node name into its kind and content.
+    
+    Args:
+        name: Node name such as "EVENT|description"
+        
+    Returns:
+        Tuple of (NodeKind, content); content is "" for nodes without a known prefix
+    """
+    if isinstance(name, str):
+        prefix, separator, content = name.partition("|")
+        kind = _KIND_PREFIXES.get(prefix)
+        if separator and kind is not None:
+            return kind, content
+    return NodeKind.OTHER, ""
+
+
+class NodeTable:
+    """Interned node names with their kind and content, indexed by node ID."""
+    __slots__ = ("ids", "names", "kinds", "contents")
+    
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.kinds = array("b")
+        self.contents = []
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def intern(self, name):
+        """Get the ID of a node name, adding it to the table if needed."""
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = len(self.names)
+            kind, content = parse_node(name)
+            self.ids[name] = node_id
+            self.names.append(name)
+            self.kinds.append(kind)
+            self.contents.append(content)
+        return node_id
+
+
+class TripleRecord:
+    """Fields of a triple besides its subject, predicate and object."""
+    __slots__ = ("chunk", "claim", "inferred", "extra")
+    
+    def __init__(self, chunk=_MISSING, claim=_MISSING, inferred=_MISSING, extra=None):
+        self.chunk = chunk
+        self.claim = claim
+        self.inferred = inferred
+        self.extra = extra
+
+
+_CORE_FIELDS = ("subject", "predicate", "object", "chunk", "claim", "inferred")
+
+
+class TripleGraph:
+    """Triples stored as integer-ID edges over interned node and predicate tables."""
+    __slots__ = ("nodes", "predicate_names", "predicate_ids", "subjects", "predicates", "objects", "records")
+    
+    def __init__(self):
+        self.nodes = NodeTable()
+        self.predicate_names = []
+        self.predicate_ids = {}
+        self.subjects = array("l")
+        self.predicates = array("l")
+        self.objects = array("l")
+        self.records = []
+    
+    def __len__(self):
+        return len(self.subjects)
+    
+    @classmethod
+    def from_triples(cls, triples):
+        """
+        Build a graph from a list of triple dictionaries.
+        
+        Args:
+            triples: List of dictionaries with 'subject', 'predicate', and 'object' keys
+            
+        Returns:
+            TripleGraph with one edge per triple, in the same order
+        """
+        graph = cls()
+        for triple in triples:
+            graph.add_triple(triple)
+        return graph
+    
+    def _intern_predicate(self, predicate):
+        predicate_id = self.predicate_ids.get(predicate)
+        if predicate_id is None:
+            predicate_id = len(self.predicate_names)
+            self.predicate_ids[predicate] = predicate_id
+            self.predicate_names.append(predicate)
+        return predicate_id
+    
+    def add_triple(self, triple):
+        """Append a triple dictionary as an edge."""
+        self.subjects.append(self.nodes.intern(triple["subject"]))
+        self.predicates.append(self._intern_predicate(triple["predicate"]))
+        self.objects.append(self.nodes.intern(triple["object"]))
+        
+        extra = {key: value for key, value in triple.items() if key not in _CORE_FIELDS}
+        self.records.append(TripleRecord(
+            triple.get("chunk", _MISSING),
+            triple.get("claim", _MISSING),
+            triple.get("inferred", _MISSING),
+            extra or None,
+        ))
+    
+    def edges(self):
+        """Iterate over (subject ID, predicate, object ID, record) of every edge."""
+        for i in range(len(self.subjects)):
+            yield self.subjects[i], self.predicate_names[self.predicates[i]], self.objects[i], self.records[i]
+    
+    def to_triples(self):
+        """
+        Convert the graph back to the pipeline's list of triple dictionaries.
+        
+        Returns:
+            List of dictionaries with 'subject', 'predicate', 'object' and the other fields
+        """
+        names = self.nodes.names
+        triples = []
+        for subject_id, predicate, object_id, record in self.edges():
+            triple = {"subject": names[subject_id], "predicate": predicate, "object": names[object_id]}
+            if record.chunk is not _MISSING:
+                triple["chunk"] = record.chunk
+            if record.claim is not _MISSING:
+                triple["claim"] = record.claim
+            if record.inferred is not _MISSING:
+                triple["inferred"] = record.inferred
+            if record.extra:
+                triple.update(record.extra)
+            triples.append(triple)
+        return triples
+    
+    def write_back(self, triples):
+        """
+        Update the subject and object of the triples the graph was built from.
+        
+        Args:
+            triples: The list passed to from_triples(), in the same order
+        """
+        names = self.nodes.names
+        for i, triple in enumerate(triples):
+            triple["subject"] = names[self.subjects[i]]
+            triple["object"] = names[self.objects[i]]
+    
+    def occurrence_counts(self):
+        """
+        Count how many edges each node appears in (as subject or object).
+        
+        Returns:
+            Array of counts indexed by node ID
+        """
+        counts = array("l", bytes(array("l").itemsize * len(self.nodes)))
+        for node_id in self.subjects:
+            counts[node_id] += 1
+        for node_id in self.objects:
+            counts[node_id] += 1
+        return counts
+    
+    def node_ids(self, kind=None, counts=None):
+        """
+        Get the IDs of the nodes used by at least one edge.
+        
+        Args:
+            kind: Optional NodeKind to filter on
+            counts: Optional result of occurrence_counts() to reuse
+            
+        Returns:
+            List of node IDs
+        """
+        if counts is None:
+            counts = self.occurrence_counts()
+        kinds = self.nodes.kinds
+        return [
+            node_id for node_id, count in enumerate(counts)
+            if count and (kind is None or kinds[node_id] == kind)
+        ]
+    
+    def successors(self):
+        """
+        Get the distinct successors of every node.
+        
+        Returns:
+            List of sets of node IDs, indexed by node ID
+        """
+        successors = [set() for _ in range(len(self.nodes))]
+        for subject_id, object_id in zip(self.subjects, self.objects):
+            successors[subject_id].add(object_id)
+        return successors
+    
+    def predicate_counts(self):
+        """Count the edges of each predicate, as a dictionary keyed by predicate."""
+        counts = [0] * len(self.predicate_names)
+        for predicate_id in self.predicates:
+            counts[predicate_id] += 1
+        return {predicate: counts[i] for i, predicate in enumerate(self.predicate_names) if counts[i]}
+    
+    def rename_nodes(self, new_names):
+        """
+        Rename nodes, merging nodes that end up with the same name.
+        
+        Args:
+            new_names: Dictionary mapping node ID to its new name
+            
+        Returns:
+            Dictionary mapping the old names of the renamed nodes to their new names
+        """
+        names = self.nodes.names
+        remap = array("l", range(len(self.nodes)))
+        renames = {}
+        for node_id, name in new_names.items():
+            remap[node_id] = self.nodes.intern(name)
+            if name != names[node_id]:
+                renames[names[node_id]] = name
+        
+        for i in range(len(self.subjects)):
+            self.subjects[i] = remap[self.subjects[i]]
+            self.objects[i] = remap[self.objects[i]]
+        return renames
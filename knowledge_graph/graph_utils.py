@@ -0,0 +1,82 @@
+"""Graph algorithms shared by the standardization and inference stages."""
+
+
+class UnionFind:
+    """
+    Disjoint-set forest with path compression and union by size.
+    
+    Elements are added implicitly by find() and union(); every operation runs in
+    nearly constant amortized time and no recursion is involved.
+    """
+    
+    def __init__(self, elements=()):
+        self.parent = {}
+        self.size = {}
+        for element in elements:
+            self.add(element)
+    
+    def add(self, element):
+        """Add an element as its own set if it is not known yet."""
+        if element not in self.parent:
+            self.parent[element] = element
+            self.size[element] = 1
+    
+    def find(self, element):
+        """Get the representative of the set containing the element."""
+        self.add(element)
+        root = element
+        while self.parent[root] != root:
+            root = self.parent[root]
+        
+        # Path compression
+        while self.parent[element] != root:
+            self.parent[element], element = root, self.parent[element]
+        return root
+    
+    def union(self, a, b):
+        """
+        Merge the sets containing a and b.
+        
+        Returns:
+            The representative of the merged set
+        """
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        
+        # Attach the smaller tree under the larger one
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+    
+    def groups(self):
+        """
+        Get all sets.
+        
+        Returns:
+            List of sets of elements
+        """
+        groups = {}
+        for element in self.parent:
+            groups.setdefault(self.find(element), set()).add(element)
+        return list(groups.values())
+
+
+def connected_components(graph):
+    """
+    Find the weakly connected components of a directed graph.
+    
+    Args:
+        graph: Dictionary mapping each node to the set of its successors
+        
+    Returns:
+        List of sets, where each set contains the nodes of one component
+    """
+    components = UnionFind()
+    for node, targets in graph.items():
+        components.add(node)
+        for target in targets:
+            components.union(node, target)
+    return components.groups()
@@ -0,0 +1,112 @@
+"""Offline force-directed layout for large knowledge graph visualizations."""
+import numpy as np
+
+
+def _grid_repulsion(pos, mass, grid_size, repulsion, block_size=1024):
+    """
+    Approximate the ForceAtlas2 repulsion of every node pair on a grid.
+    
+    Nodes are binned into grid_size x grid_size cells and every node is repelled
+    by the center of mass of each cell (Barnes-Hut with a single level), so one
+    iteration costs O(nodes * cells) instead of O(nodes^2).
+    """
+    n = len(pos)
+    lower = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lower, 1e-9)
+    cell_xy = np.minimum(((pos - lower) / span * grid_size).astype(np.int64), grid_size - 1)
+    cell = cell_xy[:, 0] * grid_size + cell_xy[:, 1]
+    
+    cell_count = grid_size * grid_size
+    cell_mass = np.bincount(cell, weights=mass, minlength=cell_count)
+    cell_x = np.bincount(cell, weights=mass * pos[:, 0], minlength=cell_count)
+    cell_y = np.bincount(cell, weights=mass * pos[:, 1], minlength=cell_count)
+    occupied = cell_mass > 0
+    centers = np.stack([cell_x[occupied], cell_y[occupied]], axis=1) / cell_mass[occupied, None]
+    masses = cell_mass[occupied]
+    
+    # Force of magnitude repulsion * m_i * M_c / d along the direction from the cell
+    displacement = np.zeros_like(pos)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        dx = pos[start:stop, 0, None] - centers[None, :, 0]
+        dy = pos[start:stop, 1, None] - centers[None, :, 1]
+        strength = masses[None, :] / (dx * dx + dy * dy + 1e-9)
+        displacement[start:stop, 0] = (strength * dx).sum(axis=1)
+        displacement[start:stop, 1] = (strength * dy).sum(axis=1)
+    displacement *= repulsion * mass[:, None]
+    
+    # The node's own cell must not include the node itself
+    center_index = np.cumsum(occupied) - 1
+    own_center = centers[center_index[cell]]
+    own_mass = masses[center_index[cell]]
+    diff = pos - own_center
+    displacement -= (repulsion * mass * own_mass / ((diff ** 2).sum(axis=1) + 1e-9))[:, None] * diff
+    
+    other_mass = own_mass - mass
+    has_others = other_mass > 1e-9
+    other_center = (own_center * own_mass[:, None] - pos * mass[:, None])[has_others] / other_mass[has_others, None]
+    diff = pos[has_others] - other_center
+    displacement[has_others] += (
+        repulsion * mass[has_others] * other_mass[has_others] / ((diff ** 2).sum(axis=1) + 1e-9)
+    )[:, None] * diff
+    return displacement
+
+
+def force_layout(nodes, edges, iterations=100, repulsion=2.0, gravity=1.0, edge_length=100, seed=42):
+    """
+    Compute 2D node positions with a ForceAtlas2-style force-directed layout.
+    
+    Args:
+        nodes: List of node identifiers
+        edges: Iterable of (source, target) pairs of nodes
+        iterations: Number of simulation steps
+        repulsion: Repulsion strength between nodes (scaled by their degrees)
+        gravity: Pull of every node towards the center
+        edge_length: Median edge length of the result, in vis.js pixels
+        seed: Random seed of the initial positions
+    
+    Returns:
+        Dictionary mapping each node to its (x, y) position
+    """
+    n = len(nodes)
+    if n == 0:
+        return {}
+    
+    index = {node: i for i, node in enumerate(nodes)}
+    pairs = [(index[source], index[target]) for source, target in edges if source in index and target in index]
+    source = np.array([pair[0] for pair in pairs], dtype=np.int64)
+    target = np.array([pair[1] for pair in pairs], dtype=np.int64)
+    
+    # Nodes with more connections push harder, as in ForceAtlas2
+    mass = np.bincount(source, minlength=n) + np.bincount(target, minlength=n) + 1.0
+    
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-1.0, 1.0, size=(n, 2)) * np.sqrt(n)
+    grid_size = int(min(24, max(4, np.sqrt(n) / 6)))
+    
+    # Maximum step per iteration, cooled down linearly
+    start_temperature = np.sqrt(n) / 10 + 1
+    for iteration in range(iterations):
+        displacement = _grid_repulsion(pos, mass, grid_size, repulsion)
+        
+        # Linear attraction along edges
+        delta = pos[source] - pos[target]
+        for axis in range(2):
+            pull = np.bincount(source, weights=delta[:, axis], minlength=n) - np.bincount(target, weights=delta[:, axis], minlength=n)
+            displacement[:, axis] -= pull
+        
+        # Constant gravity towards the center keeps components together
+        distance = np.linalg.norm(pos, axis=1) + 1e-9
+        displacement -= (gravity * mass / distance)[:, None] * pos
+        
+        temperature = start_temperature * (1 - iteration / iterations) + 0.01
+        length = np.linalg.norm(displacement, axis=1) + 1e-9
+        pos += displacement * (np.minimum(length, temperature) / length)[:, None]
+    
+    # Scale to vis.js pixels
+    if len(source):
+        median_length = np.median(np.linalg.norm(pos[source] - pos[target], axis=1))
+        if median_length > 0:
+            pos *= edge_length / median_length
+    
+    return {node: (float(pos[i, 0]), float(pos[i, 1])) for i, node in enumerate(nodes)}
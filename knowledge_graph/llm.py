@@ -1,11 +1,72 @@
 """LLM interaction utilities for knowledge graph generation."""
+import os
 import re
 import json
 import time
+import sqlite3
+import hashlib
 import random
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 from itertools import cycle
-from threading import Lock
+from threading import Lock, Condition, Event
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import namedtuple, deque
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency, only needed by AsyncLLM / acall_llm
+    aiohttp = None
+
+from knowledge_graph.text_utils import estimate_tokens
+from knowledge_graph.backends import (
+    HTTPBackend,
+    Response as _Response,
+    TransportError as _TransportError,
+    get_llm_backend,
+)
+from knowledge_graph.metrics import record, bind_context
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously, holding at most one minute of budget.
+    
+    Not thread-safe on its own; APIKeyManager guards its buckets with its lock.
+    """
+    
+    def __init__(self, per_minute):
+        """
+        Initialize a full bucket.
+        
+        Args:
+            per_minute: Budget replenished every minute (also the bucket capacity)
+        """
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.time()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def available(self, now):
+        """Get the remaining budget."""
+        self._refill(now)
+        return self.tokens
+    
+    def time_until(self, amount, now):
+        """Get the number of seconds until `amount` can be consumed."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+    
+    def consume(self, amount, now):
+        """Take `amount` from the bucket (capped at the capacity)."""
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
 
 
 class APIKeyManager:
@@ -16,16 +77,19 @@ class APIKeyManager:
     - Round-robin key rotation for load distribution
     - Automatic key switching on 429 errors
     - Per-key cooldown tracking
+    - Optional per-key requests/tokens per minute budgets (token buckets)
     - Thread-safe operations
     """
     
-    def __init__(self, api_keys, cooldown_time=60):
+    def __init__(self, api_keys, cooldown_time=60, rpm_limit=0, tpm_limit=0):
         """
         Initialize the API key manager.
         
         Args:
             api_keys: List of API keys or single API key string
             cooldown_time: Time in seconds to wait before reusing a rate-limited key
+            rpm_limit: Requests per minute allowed for each key (0 = unlimited)
+            tpm_limit: Prompt tokens per minute allowed for each key (0 = unlimited)
         """
         # Handle both single key (backward compatibility) and multiple keys
         if isinstance(api_keys, str):
@@ -53,20 +117,35 @@ class APIKeyManager:
         # Default cooldown time
         self.cooldown_time = cooldown_time
         
+        # Per-key budgets: {key: TokenBucket}, empty if unlimited
+        self.request_buckets = {key: TokenBucket(rpm_limit) for key in self.api_keys} if rpm_limit > 0 else {}
+        self.token_buckets = {key: TokenBucket(tpm_limit) for key in self.api_keys} if tpm_limit > 0 else {}
+        
         # Thread lock for thread-safe operations
         self.lock = Lock()
         
         print(f"🔑 API Key Manager initialized with {len(self.api_keys)} key(s)")
     
-    def get_next_available_key(self):
+    def get_next_available_key(self, estimated_tokens=0, exclude=()):
         """
         Get the next available API key that is not in cooldown.
         
+        When per-key budgets are configured, the key with the most remaining budget
+        is chosen and the request is charged to it.
+        
+        Args:
+            estimated_tokens: Estimated prompt tokens of the request (for the tokens budget)
+            exclude: Keys not to use (e.g. the key of the request being hedged)
+        
         Returns:
-            A tuple of (api_key, key_index) or (None, None) if all keys are in cooldown
+            A tuple of (api_key, key_index) or (None, wait_time) if no key can be used now
         """
         with self.lock:
             current_time = time.time()
+            
+            if self.request_buckets or self.token_buckets:
+                return self._get_key_with_most_budget(estimated_tokens, current_time, exclude)
+            
             attempts = 0
             max_attempts = len(self.api_keys)
             
@@ -76,7 +155,7 @@ class APIKeyManager:
                 key_index = self.api_keys.index(key)
                 
                 # Check if key is not in cooldown
-                if self.key_cooldowns[key] <= current_time:
+                if self.key_cooldowns[key] <= current_time and key not in exclude:
                     self.key_usage_count[key] += 1
                     return key, key_index
                 
@@ -88,6 +167,44 @@ class APIKeyManager:
             
             return None, wait_time
     
+    def _get_key_with_most_budget(self, estimated_tokens, current_time, exclude=()):
+        """Budget-aware key selection, must be called with the lock held."""
+        best_key, best_budget = None, -1.0
+        wait_times = []
+        
+        # Start from the round-robin position so ties are spread over the keys
+        for _ in range(len(self.api_keys)):
+            key = next(self.key_cycle)
+            if key in exclude:
+                continue
+            
+            wait_time = max(0, self.key_cooldowns[key] - current_time)
+            budget = 1.0
+            if key in self.request_buckets:
+                bucket = self.request_buckets[key]
+                wait_time = max(wait_time, bucket.time_until(1, current_time))
+                budget = min(budget, bucket.available(current_time) / bucket.capacity)
+            if key in self.token_buckets:
+                bucket = self.token_buckets[key]
+                wait_time = max(wait_time, bucket.time_until(estimated_tokens, current_time))
+                budget = min(budget, bucket.available(current_time) / bucket.capacity)
+            
+            if wait_time > 0:
+                wait_times.append(wait_time)
+            elif budget > best_budget:
+                best_key, best_budget = key, budget
+        
+        if best_key is None:
+            # No key has budget left - wait for the first one to refill or cool down
+            return None, min(wait_times, default=0)
+        
+        if best_key in self.request_buckets:
+            self.request_buckets[best_key].consume(1, current_time)
+        if best_key in self.token_buckets:
+            self.token_buckets[best_key].consume(estimated_tokens, current_time)
+        self.key_usage_count[best_key] += 1
+        return best_key, self.api_keys.index(best_key)
+    
     def mark_key_rate_limited(self, api_key, retry_after=None):
         """
         Mark a key as rate-limited and put it in cooldown.
@@ -127,6 +244,784 @@ class APIKeyManager:
             return stats
 
 
+_key_managers = {}
+_key_managers_lock = Lock()
+
+
+def get_key_manager(config):
+    """
+    Get the process-wide API key manager for the configured keys.
+    
+    Every stage builds its own LLM(config), so sharing the manager keeps the
+    round-robin position and the cooldowns consistent across concurrent callers.
+    
+    Args:
+        config: Configuration dictionary
+        
+    Returns:
+        APIKeyManager instance shared by all LLM objects using the same keys
+    """
+    api_keys = config["llm"]["api_key"]
+    # Support both single key (string) and multiple keys (list)
+    if not isinstance(api_keys, list):
+        api_keys = [api_keys]
+    cooldown_time = config["llm"].get("key_cooldown_time", 60)
+    rpm_limit = config["llm"].get("rpm_limit", 0)
+    tpm_limit = config["llm"].get("tpm_limit", 0)
+    
+    cache_key = (tuple(api_keys), cooldown_time, rpm_limit, tpm_limit)
+    with _key_managers_lock:
+        if cache_key not in _key_managers:
+            _key_managers[cache_key] = APIKeyManager(
+                api_keys,
+                cooldown_time=cooldown_time,
+                rpm_limit=rpm_limit,
+                tpm_limit=tpm_limit,
+            )
+        return _key_managers[cache_key]
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM responses.
+    
+    Responses are stored in a SQLite database keyed by a hash of
+    (model, system prompt, user prompt, temperature, max_tokens). When the total
+    size of stored responses exceeds the limit, the least recently used entries
+    are evicted. Thread-safe operations.
+    """
+    
+    def __init__(self, path, max_size_mb=512, refresh=False):
+        """
+        Initialize the response cache.
+        
+        Args:
+            path: Path of the SQLite database file
+            max_size_mb: Maximum total size of cached responses in megabytes
+            refresh: If True, never read from the cache but still store new responses
+        """
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.refresh = refresh
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.commit()
+        
+        self.total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        
+        # Thread lock for thread-safe operations
+        self.lock = Lock()
+    
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt, temperature, max_tokens):
+        """Hash the request parameters that determine the response."""
+        material = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """
+        Look up a cached response.
+        
+        Returns:
+            The cached response string or None on a miss
+        """
+        with self.lock:
+            if self.refresh:
+                self.misses += 1
+                return None
+            
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def put(self, key, response):
+        """Store a response and evict least recently used entries if over the size limit."""
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.total_size -= row[0]
+            
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self.total_size += size
+            
+            if self.total_size > self.max_size:
+                self._evict()
+            self.conn.commit()
+    
+    def _evict(self):
+        """Delete least recently used entries until the cache is at 90% of its limit."""
+        target = self.max_size * 0.9
+        evicted = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if self.total_size <= target:
+                break
+            evicted.append((key,))
+            self.total_size -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+    
+    def get_statistics(self):
+        """Get hit/miss statistics of the cache."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size_mb': self.total_size / (1024 * 1024),
+            }
+
+
+_response_caches = {}
+_response_caches_lock = Lock()
+
+
+def get_response_cache(config):
+    """
+    Get the process-wide response cache configured in the [cache] section.
+    
+    Args:
+        config: Configuration dictionary
+        
+    Returns:
+        ResponseCache instance, or None if caching is disabled
+    """
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", False):
+        return None
+    
+    path = cache_config.get("path", ".llm_cache/responses.sqlite")
+    max_size_mb = cache_config.get("max_size_mb", 512)
+    refresh = cache_config.get("refresh", False)
+    
+    cache_key = (os.path.abspath(path), max_size_mb, refresh)
+    with _response_caches_lock:
+        if cache_key not in _response_caches:
+            _response_caches[cache_key] = ResponseCache(path, max_size_mb, refresh)
+        return _response_caches[cache_key]
+
+
+class _Flight:
+    """A request in flight, shared by its leader and the callers waiting for it."""
+    
+    __slots__ = ("done", "result", "error")
+    
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent requests into one.
+    
+    The first caller of a key (the leader) performs the request; callers
+    arriving with the same key while it is in flight wait for it and share its
+    response, or its exception. Keys are forgotten once the request completes,
+    so this complements the response cache rather than replacing it.
+    """
+    
+    def __init__(self):
+        self.lock = Lock()
+        self.flights = {}
+        self.tasks = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers of the same key.
+        
+        Args:
+            key: Request key (as ResponseCache.make_key)
+            fn: Function performing the request
+        
+        Returns:
+            The result of fn(), possibly computed by another thread
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.hits += 1
+        
+        if not leader:
+            record(coalesced=1)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+    
+    async def ado(self, key, make_coroutine):
+        """
+        Asynchronous counterpart of do() for callers in the same event loop.
+        
+        The request runs as its own task, so cancelling one waiting caller does
+        not cancel the request the others are waiting for.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            task = self.tasks.get((loop, key))
+            if task is None:
+                task = self.tasks[(loop, key)] = loop.create_task(make_coroutine())
+                task.add_done_callback(lambda _: self._forget_task(loop, key))
+                self.misses += 1
+            else:
+                self.hits += 1
+                record(coalesced=1)
+        return await asyncio.shield(task)
+    
+    def _forget_task(self, loop, key):
+        with self.lock:
+            self.tasks.pop((loop, key), None)
+    
+    def get_statistics(self):
+        """Get the number of coalesced (hits) and performed (misses) requests."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight(config):
+    """
+    Get the process-wide request coalescer.
+    
+    Args:
+        config: Configuration dictionary
+    
+    Returns:
+        SingleFlight instance, or None if [llm] coalesce_requests is disabled
+    """
+    if not config["llm"].get("coalesce_requests", True):
+        return None
+    return _single_flight
+
+
+class HedgingPolicy:
+    """
+    Decide when a slow request gets a duplicate (hedge) on another key.
+    
+    A request still running after the given percentile of the recently observed
+    latencies is hedged, unless hedges already make up max_fraction of the
+    requests, which bounds the extra quota spent on them.
+    """
+    
+    def __init__(self, percentile=0.95, max_fraction=0.05, min_samples=20, window=500, min_delay=1.0):
+        """
+        Initialize the policy.
+        
+        Args:
+            percentile: Latency percentile after which a request is hedged
+            max_fraction: Maximum number of hedges per request sent
+            min_samples: Latencies to observe before hedging anything
+            window: Number of recent latencies the percentile is computed on
+            min_delay: Minimum time in seconds before hedging
+        """
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.lock = Lock()
+        
+        # Threads waiting for blocking requests, so the caller can wait with a timeout
+        self.executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-hedge")
+    
+    def start_request(self):
+        """
+        Count a new request.
+        
+        Returns:
+            Seconds after which the request may be hedged, or None to never hedge it
+        """
+        with self.lock:
+            self.requests += 1
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        return max(self.min_delay, latencies[int(self.percentile * (len(latencies) - 1))])
+    
+    def observe(self, outcome, seconds):
+        """Record the latency of a successful request."""
+        if isinstance(outcome, _Response) and outcome.status_code == 200:
+            with self.lock:
+                self.latencies.append(seconds)
+    
+    def hedge_key(self, key_manager, api_key, estimated_tokens=0):
+        """
+        Get a key to hedge a request with, if the fraction of hedged traffic allows it.
+        
+        Args:
+            key_manager: APIKeyManager the request's key comes from
+            api_key: Key of the request, never used for its hedge
+            estimated_tokens: Estimated prompt tokens, charged to the hedge key's budget
+        
+        Returns:
+            API key of the hedge, or None if the request must not be hedged
+        """
+        with self.lock:
+            if self.hedges + 1 > self.max_fraction * self.requests:
+                return None
+            # Reserved so concurrent requests do not exceed the fraction
+            self.hedges += 1
+        
+        hedge_key, _ = key_manager.get_next_available_key(estimated_tokens, exclude={api_key})
+        if hedge_key is None:
+            # No other key is available: nothing is sent, give the reservation back
+            with self.lock:
+                self.hedges -= 1
+            return None
+        record(hedges=1)
+        return hedge_key
+    
+    def hedge_won(self):
+        with self.lock:
+            self.hedge_wins += 1
+        record(hedge_wins=1)
+    
+    def get_statistics(self):
+        """Get the number of requests, hedges and hedges that answered first."""
+        with self.lock:
+            return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins}
+
+
+_hedging_policies = {}
+_hedging_policies_lock = Lock()
+
+
+def get_hedging_policy(config):
+    """
+    Get the process-wide hedging policy configured in the [llm] section.
+    
+    Args:
+        config: Configuration dictionary
+    
+    Returns:
+        HedgingPolicy instance, or None if hedging is disabled
+    """
+    llm_config = config["llm"]
+    if not llm_config.get("hedging", False):
+        return None
+    
+    percentile = llm_config.get("hedge_percentile", 0.95)
+    max_fraction = llm_config.get("hedge_max_fraction", 0.05)
+    min_samples = llm_config.get("hedge_min_samples", 20)
+    
+    cache_key = (percentile, max_fraction, min_samples)
+    with _hedging_policies_lock:
+        if cache_key not in _hedging_policies:
+            _hedging_policies[cache_key] = HedgingPolicy(percentile, max_fraction, min_samples)
+        return _hedging_policies[cache_key]
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of in-flight LLM requests with an AIMD policy.
+    
+    The limit grows additively (about +1 per limit successful responses) and is
+    halved when the endpoint signals overload (429, 5xx, timeouts). A burst of
+    overload responses to requests sent before the last decrease only halves the
+    limit once. Shared by threads and asyncio tasks.
+    """
+    
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64):
+        """
+        Initialize the limiter.
+        
+        Args:
+            initial_limit: Starting number of concurrent requests
+            min_limit: Lower bound of the limit
+            max_limit: Upper bound of the limit
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        
+        self.condition = Condition()
+        # Futures of asyncio tasks waiting for a slot: (event loop, future)
+        self.async_waiters = deque()
+    
+    def _try_acquire(self):
+        """Take a slot if one is free, must be called with the condition held."""
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+    
+    def acquire(self):
+        """
+        Block until a request slot is free.
+        
+        Returns:
+            Start timestamp to pass back to release()
+        """
+        with self.condition:
+            while not self._try_acquire():
+                self.condition.wait()
+        return time.time()
+    
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a request slot is free."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self._try_acquire():
+                    return time.time()
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+    
+    def release(self, started_at, overloaded=False, succeeded=False):
+        """
+        Free a request slot and adapt the limit to the response.
+        
+        Args:
+            started_at: Timestamp returned by acquire()
+            overloaded: The endpoint signalled overload (429, 5xx, timeout)
+            succeeded: The request completed successfully
+        """
+        with self.condition:
+            self.in_flight -= 1
+            
+            if overloaded and started_at > self.last_decrease:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.last_decrease = time.time()
+                print(f"📉 Endpoint overloaded, lowering concurrency limit to {int(self.limit)}")
+            elif succeeded:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            
+            self.condition.notify_all()
+            waiters = list(self.async_waiters)
+            self.async_waiters.clear()
+        
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake_waiter, waiter)
+
+
+def _wake_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_limiters = {}
+_limiters_lock = Lock()
+
+
+def get_concurrency_limiter(config):
+    """
+    Get the process-wide adaptive concurrency limiter for the configured endpoint.
+    
+    Args:
+        config: Configuration dictionary
+        
+    Returns:
+        AdaptiveConcurrencyLimiter instance, or None if adaptive concurrency is disabled
+    """
+    llm_config = config["llm"]
+    if not llm_config.get("adaptive_concurrency", False):
+        return None
+    
+    cache_key = llm_config.get("base_url")
+    with _limiters_lock:
+        if cache_key not in _limiters:
+            _limiters[cache_key] = AdaptiveConcurrencyLimiter(
+                initial_limit=llm_config.get("initial_concurrency", 4),
+                max_limit=llm_config.get("max_concurrency", 64),
+            )
+        return _limiters[cache_key]
+
+
+class CircuitBreaker:
+    """
+    Shared backoff state of all callers of one endpoint.
+    
+    While the circuit is closed, callers back off on their own after a failure.
+    When at least failure_threshold of the last window responses are server
+    errors or network failures, and they make up failure_rate of them, the
+    circuit opens and callers park on it instead. Rate limits are not counted,
+    key rotation handles them. Once reset_timeout has passed it is half-open: a single caller sends a probe
+    request while the others stay parked. A probe answered by the server closes
+    the circuit and wakes the parked callers, spread over release_spread seconds
+    so they do not hit the recovering endpoint at once. A failed probe opens the
+    circuit again for twice as long, up to max_reset_timeout. Shared by threads
+    and asyncio tasks.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    
+    def __init__(self, failure_threshold=5, failure_rate=0.5, window=20, reset_timeout=5.0,
+                 max_reset_timeout=300.0, probe_timeout=120.0, release_spread=2.0):
+        """
+        Initialize the circuit breaker.
+        
+        Args:
+            failure_threshold: Minimum number of recent failures that opens the circuit
+            failure_rate: Minimum fraction of failed recent responses that opens the circuit
+            window: Number of recent responses the failures are counted on
+            reset_timeout: Seconds the circuit stays open before the first probe
+            max_reset_timeout: Upper bound of the open time after failed probes
+            probe_timeout: Seconds after which an unanswered probe is given up
+            release_spread: Seconds over which parked callers are released
+        """
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.probe_timeout = probe_timeout
+        self.release_spread = release_spread
+        
+        self.state = self.CLOSED
+        # Recent responses while closed: True for a failure
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.open_for = reset_timeout
+        self.probe_started_at = 0.0
+        self.trips = 0
+        self.parked = 0
+        
+        self.condition = Condition()
+        # Futures of asyncio tasks parked on the circuit: (event loop, future)
+        self.async_waiters = deque()
+    
+    def _try_admit(self):
+        """
+        Decide whether a request may be sent, must be called with the condition held.
+        
+        Returns:
+            Tuple of (admitted, probe, seconds to wait before asking again)
+        """
+        now = time.time()
+        if self.state == self.CLOSED:
+            return True, False, 0
+        
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_for - now
+            if remaining > 0:
+                return False, False, remaining
+            self.state = self.HALF_OPEN
+            self.probe_started_at = now
+            print("🔌 Circuit half-open, sending a probe request...")
+            return True, True, 0
+        
+        # Half-open: the probe is in flight, unless its caller gave up on it
+        remaining = self.probe_started_at + self.probe_timeout - now
+        if remaining > 0:
+            return False, False, remaining
+        self.probe_started_at = now
+        return True, True, 0
+    
+    def acquire(self):
+        """
+        Block while the circuit is open.
+        
+        Returns:
+            Tuple of (the caller must send the probe request, the caller was parked)
+        """
+        parked = False
+        with self.condition:
+            while True:
+                admitted, probe, wait_time = self._try_admit()
+                if admitted:
+                    break
+                if not parked:
+                    parked = True
+                    self.parked += 1
+                    record(circuit_parked=1)
+                self.condition.wait(wait_time)
+        
+        if parked and not probe:
+            time.sleep(random.uniform(0, self.release_spread))
+        return probe, parked
+    
+    async def acquire_async(self):
+        """Wait without blocking the event loop while the circuit is open (see acquire)."""
+        loop = asyncio.get_running_loop()
+        parked = False
+        while True:
+            with self.condition:
+                admitted, probe, wait_time = self._try_admit()
+                if admitted:
+                    break
+                if not parked:
+                    parked = True
+                    self.parked += 1
+                    record(circuit_parked=1)
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await asyncio.wait([waiter], timeout=wait_time)
+        
+        if parked and not probe:
+            await asyncio.sleep(random.uniform(0, self.release_spread))
+        return probe, parked
+    
+    def _wake_parked(self):
+        """Wake the parked callers, must be called with the condition held."""
+        self.condition.notify_all()
+        waiters = list(self.async_waiters)
+        self.async_waiters.clear()
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake_waiter, waiter)
+    
+    def _open(self, open_for):
+        """Open the circuit, must be called with the condition held."""
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.open_for = open_for
+        self.outcomes.clear()
+        self.trips += 1
+        print(f"🔌 Endpoint failing, circuit open: requests paused for {open_for:.0f}s")
+        self._wake_parked()
+    
+    def record_success(self, probe=False):
+        """
+        Count a response of the server.
+        
+        Args:
+            probe: The response answered the probe of the half-open circuit
+        """
+        with self.condition:
+            if self.state == self.CLOSED:
+                self.outcomes.append(False)
+            elif probe:
+                self.state = self.CLOSED
+                self.open_for = self.reset_timeout
+                print("✅ Endpoint recovered, circuit closed")
+                self._wake_parked()
+    
+    def record_failure(self, probe=False):
+        """
+        Count a server error or network failure.
+        
+        Args:
+            probe: The failed request was the probe of the half-open circuit
+        """
+        with self.condition:
+            if self.state == self.HALF_OPEN and probe:
+                self._open(min(self.max_reset_timeout, self.open_for * 2))
+            elif self.state == self.CLOSED:
+                self.outcomes.append(True)
+                failures = sum(self.outcomes)
+                if failures >= self.failure_threshold and failures >= self.failure_rate * len(self.outcomes):
+                    self._open(self.reset_timeout)
+    
+    def abandon_probe(self):
+        """Let another caller probe immediately, the probe request was never answered."""
+        with self.condition:
+            if self.state == self.HALF_OPEN:
+                self.probe_started_at = 0.0
+                self._wake_parked()
+    
+    def get_statistics(self):
+        """Get the circuit state, how often it opened and how many calls were parked."""
+        with self.condition:
+            return {'state': self.state, 'trips': self.trips, 'parked': self.parked}
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def get_circuit_breaker(config):
+    """
+    Get the process-wide circuit breaker for the configured endpoint.
+    
+    Args:
+        config: Configuration dictionary
+    
+    Returns:
+        CircuitBreaker instance, or None if the circuit breaker is disabled
+    """
+    llm_config = config["llm"]
+    if not llm_config.get("circuit_breaker", False):
+        return None
+    
+    cache_key = llm_config.get("base_url")
+    with _breakers_lock:
+        if cache_key not in _breakers:
+            _breakers[cache_key] = CircuitBreaker(
+                failure_threshold=llm_config.get("breaker_failure_threshold", 5),
+                failure_rate=llm_config.get("breaker_failure_rate", 0.5),
+                reset_timeout=llm_config.get("breaker_reset_timeout", 5.0),
+                max_reset_timeout=llm_config.get("breaker_max_reset_timeout", 300.0),
+            )
+        return _breakers[cache_key]
+
+
+_sessions = {}
+_sessions_lock = Lock()
+
+
+def get_http_session(pool_size=16, keep_alive=True):
+    """
+    Get a process-wide pooled HTTP session.
+    
+    Reusing one session keeps TCP/TLS connections to the endpoint alive between
+    calls. The underlying urllib3 connection pool is thread-safe, so the session
+    is shared by all threads issuing requests.
+    
+    Args:
+        pool_size: Maximum number of connections kept open per host
+        keep_alive: Whether connections are reused between requests
+        
+    Returns:
+        requests.Session shared by all callers with the same settings
+    """
+    cache_key = (pool_size, keep_alive)
+    with _sessions_lock:
+        if cache_key not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            _sessions[cache_key] = session
+        return _sessions[cache_key]
+
+
 class LLM:
     """Enhanced LLM class with API key rotation support."""
     
@@ -142,46 +1037,142 @@ class LLM:
         """
         self.model = config["llm"]["model"]
         
-        # Initialize API key manager
-        api_keys = config["llm"]["api_key"]
-        # Support both single key (string) and multiple keys (list)
-        if not isinstance(api_keys, list):
-            api_keys = [api_keys]
-        
-        self.key_manager = APIKeyManager(
-            api_keys,
-            cooldown_time=config["llm"].get("key_cooldown_time", 60)
-        )
+        # Shared API key manager
+        self.key_manager = get_key_manager(config)
         
         self.max_tokens = config["llm"]["max_tokens"]
         self.temperature = config["llm"]["temperature"]
         self.base_url = config["llm"]["base_url"]
+        
+        # Shared connection pool
+        self.pool_size = config["llm"].get("pool_size", 16)
+        self.keep_alive = config["llm"].get("keep_alive", True)
+        self.session = get_http_session(self.pool_size, self.keep_alive)
+        
+        # Shared response cache (None if disabled)
+        self.cache = get_response_cache(config)
+        
+        # Shared adaptive concurrency limiter (None if disabled)
+        self.limiter = get_concurrency_limiter(config)
 
+        # Shared coalescing of identical in-flight requests (None if disabled)
+        self.single_flight = get_single_flight(config)
+        
+        # Shared hedging of slow requests (None if disabled)
+        self.hedging = get_hedging_policy(config)
+        
+        # Shared backoff on server errors (None if disabled)
+        self.breaker = get_circuit_breaker(config)
+        
+        # Transport: HTTP, record/replay or synthetic responses
+        self.backend = get_llm_backend(config)
+    
     def __call__(self, system_prompt, user_prompt):
-        return call_llm(
+        cache_key = self._cache_key(system_prompt, user_prompt)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record(cache_hits=1)
+                return cached
+        
+        if self.single_flight is None:
+            return self._request(system_prompt, user_prompt, cache_key)
+        return self.single_flight.do(
+            cache_key or self._request_key(system_prompt, user_prompt),
+            lambda: self._request(system_prompt, user_prompt, cache_key),
+        )
+    
+    def _request(self, system_prompt, user_prompt, cache_key):
+        response = call_llm(
             self.model, user_prompt, self.key_manager, system_prompt,
             self.max_tokens, self.temperature, self.base_url,
+            session=self.session, limiter=self.limiter, backend=self.backend, hedging=self.hedging,
+            breaker=self.breaker,
         )
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+    
+    def _request_key(self, system_prompt, user_prompt):
+        """Get the key identifying identical requests (the response cache key)."""
+        return ResponseCache.make_key(self.model, system_prompt, user_prompt, self.temperature, self.max_tokens)
+    
+    def _cache_key(self, system_prompt, user_prompt):
+        """Get the response cache key of a request, or None if caching is disabled."""
+        if self.cache is None:
+            return None
+        return self._request_key(system_prompt, user_prompt)
 
 
-def call_llm(model, user_prompt, key_manager, system_prompt=None, 
-             max_tokens=1000, temperature=0.2, base_url=None) -> str:
+class AsyncLLM(LLM):
     """
-    Call the language model API with automatic key rotation on rate limits.
+    Asynchronous counterpart of LLM built on aiohttp.
     
-    Args:
-        model: The model name to use
-        user_prompt: The user prompt to send
-        key_manager: APIKeyManager instance for handling multiple keys
-        system_prompt: Optional system prompt to set context
-        max_tokens: Maximum number of tokens to generate
-        temperature: Sampling temperature
-        base_url: The base URL for the API endpoint
-        
-    Returns:
-        The model's response as a string
+    Calls are coroutines, so many requests can be in flight from a single thread:
+    
+        async with AsyncLLM(config) as llm:
+            responses = await asyncio.gather(*(llm(system, user) for user in prompts))
     """
     
+    def __init__(self, config):
+        super().__init__(config)
+        self._session = None
+    
+    async def __call__(self, system_prompt, user_prompt):
+        cache_key = self._cache_key(system_prompt, user_prompt)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record(cache_hits=1)
+                return cached
+        
+        if self.single_flight is None:
+            return await self._arequest(system_prompt, user_prompt, cache_key)
+        return await self.single_flight.ado(
+            cache_key or self._request_key(system_prompt, user_prompt),
+            lambda: self._arequest(system_prompt, user_prompt, cache_key),
+        )
+    
+    async def _arequest(self, system_prompt, user_prompt, cache_key):
+        response = await acall_llm(
+            self.model, user_prompt, self.key_manager, system_prompt,
+            self.max_tokens, self.temperature, self.base_url,
+            session=self._get_session(), limiter=self.limiter, backend=self.backend, hedging=self.hedging,
+            breaker=self.breaker,
+        )
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+    
+    def _get_session(self):
+        """Create the aiohttp session lazily, inside the running event loop."""
+        if self._session is None or self._session.closed:
+            self._session = _new_aiohttp_session(self.pool_size, self.keep_alive)
+        return self._session
+    
+    async def aclose(self):
+        """Close the underlying HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+# Steps yielded by _call_llm_steps and the outcomes sent back by the drivers
+_Sleep = namedtuple("_Sleep", ["seconds"])
+_Post = namedtuple("_Post", ["api_key"])
+_Admit = namedtuple("_Admit", ["breaker"])
+
+
+def _build_payload(model, user_prompt, system_prompt, max_tokens, temperature):
+    """Build the chat completion request body."""
     messages = []
     
     if system_prompt:
@@ -200,152 +1191,510 @@ def call_llm(model, user_prompt, key_manager, system_prompt=None,
         ]
     })
     
-    payload = {
+    return {
         'model': model,
         'messages': messages,
         'max_tokens': max_tokens,
         'temperature': temperature
     }
+
+
+def _extract_message_content(response_json):
+    """
+    Extract the generated text from a chat completion response.
     
-    max_retries = 15  # Increased retries to handle key rotation
-    base_retry_delay = 5  # seconds
+    Raises:
+        KeyError, IndexError or TypeError if the response is malformed
+    """
+    # Validate response structure
+    if 'choices' not in response_json:
+        print(f"⚠️  Warning: Response missing 'choices' field")
+        raise KeyError("'choices' not found in response")
     
-    for attempt in range(max_retries):
-        # Get next available API key
-        api_key, wait_or_index = key_manager.get_next_available_key()
+    if len(response_json['choices']) == 0:
+        print(f"⚠️  Warning: Response has empty 'choices' array")
+        raise KeyError("'choices' array is empty")
+    
+    message = response_json['choices'][0].get('message', {})
+    
+    if 'content' not in message:
+        print(f"⚠️  Warning: Message missing 'content' field")
         
-        # If all keys are in cooldown, wait for the shortest cooldown
-        if api_key is None:
-            wait_time = wait_or_index
-            if wait_time > 0:
-                jitter = random.uniform(0.5, 2.5)
-                total_wait = wait_time + jitter
-                print(f"⏳ All API keys in cooldown. Waiting {total_wait:.1f}s before retry {attempt + 1}/{max_retries}...")
-                time.sleep(total_wait)
-                continue
+        # Try alternative fields
+        if 'text' in message:
+            print("✅ Found 'text' field instead of 'content'")
+            return message['text']
         
-        # Prepare headers with current API key
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f"Bearer {api_key}"
-        }
+        raise KeyError("'content' not found in message")
+    
+    return message['content']
+
+
+def _parse_retry_after(error_data):
+    """
+    Extract the retry delay from a Google RetryInfo error detail.
+    
+    Args:
+        error_data: Parsed JSON body of a 429 response
         
+    Returns:
+        Retry delay in seconds (with a 1s buffer) or None if not present
+    """
+    try:
+        if 'error' in error_data and 'details' in error_data['error']:
+            for detail in error_data['error']['details']:
+                if detail.get('@type') == 'type.googleapis.com/google.rpc.RetryInfo':
+                    retry_info = detail.get('retryDelay', '')
+                    if retry_info:
+                        # Parse retry delay (format: "26s" or "26.400891299s")
+                        return float(retry_info.rstrip('s')) + 1  # Add 1s buffer
+                    break
+    except:
+        pass
+    return None
+
+
+def _call_llm_steps(key_manager, estimated_tokens=0, max_retries=15, base_retry_delay=5, breaker=None,
+                    max_retry_delay=60):
+    """
+    Retry and key-rotation logic shared by call_llm and acall_llm.
+    
+    The generator performs no I/O itself: it yields _Sleep, _Admit and _Post
+    steps, the driver executes them and sends back whether the call must send
+    the probe request for every _Admit, and a _Response or _TransportError for
+    every _Post. The generator returns the model's response text.
+    
+    Args:
+        key_manager: APIKeyManager instance for handling multiple keys
+        estimated_tokens: Estimated prompt tokens, charged to the per-key budget
+        max_retries: Maximum number of attempts
+        base_retry_delay: Base delay in seconds for exponential backoff
+        breaker: Optional CircuitBreaker pausing all callers while the endpoint fails
+        max_retry_delay: Upper bound in seconds of the exponential backoff
+    """
+    for attempt in range(max_retries):
         # Add small delay between requests to avoid hammering (0.5-2.5s)
         if attempt > 0:
             jitter = random.uniform(0.5, 2.5)
-            time.sleep(jitter)
+            yield _Sleep(jitter)
+        
+        # Park while the endpoint is failing, before charging a key's budget
+        probe = parked = False
+        if breaker is not None:
+            probe, parked = yield _Admit(breaker)
         
         try:
-            response = requests.post(
-                base_url,
-                headers=headers,
-                json=payload,
-                timeout=120  # 2 minute timeout
-            )
+            # Get next available API key
+            api_key, wait_time = key_manager.get_next_available_key(estimated_tokens)
             
-            # Success - parse and return
-            if response.status_code == 200:
-                try:
-                    response_json = response.json()
-                    
-                    # Validate response structure
-                    if 'choices' not in response_json:
-                        print(f"⚠️  Warning: Response missing 'choices' field")
-                        raise KeyError("'choices' not found in response")
-                    
-                    if len(response_json['choices']) == 0:
-                        print(f"⚠️  Warning: Response has empty 'choices' array")
-                        raise KeyError("'choices' array is empty")
-                    
-                    message = response_json['choices'][0].get('message', {})
-                    
-                    if 'content' not in message:
-                        print(f"⚠️  Warning: Message missing 'content' field")
-                        
-                        # Try alternative fields
-                        if 'text' in message:
-                            print("✅ Found 'text' field instead of 'content'")
-                            return message['text']
-                        
-                        raise KeyError("'content' not found in message")
-                    
-                    return message['content']
-                    
-                except (KeyError, IndexError, TypeError) as e:
-                    print(f"❌ Error parsing response: {e}")
-                    
-                    # Retry with exponential backoff for parsing errors
-                    if attempt < max_retries - 1:
-                        wait_time = base_retry_delay * (2 ** attempt)
-                        jitter = random.uniform(0, wait_time * 0.2)
-                        total_wait = wait_time + jitter
-                        print(f"🔄 Malformed response, waiting {total_wait:.1f}s before retry {attempt + 2}/{max_retries}...")
-                        time.sleep(total_wait)
-                        continue
-                    else:
-                        raise Exception(f"API response parsing failed after {max_retries} retries: {e}")
+            # If all keys are in cooldown, wait for the shortest cooldown
+            # (waiting for budget is pacing, not a failed attempt)
+            while api_key is None:
+                jitter = random.uniform(0.5, 2.5)
+                total_wait = max(wait_time, 0) + jitter
+                print(f"⏳ All API keys in cooldown or out of budget. Waiting {total_wait:.1f}s before attempt {attempt + 1}/{max_retries}...")
+                yield _Sleep(total_wait)
+                api_key, wait_time = key_manager.get_next_available_key(estimated_tokens)
             
-            # Rate limit hit - mark key as rate-limited and try next key
-            elif response.status_code == 429:
-                # Try to extract retry-after time from response
-                retry_after = None
-                try:
-                    error_data = response.json()
-                    if 'error' in error_data and 'details' in error_data['error']:
-                        for detail in error_data['error']['details']:
-                            if detail.get('@type') == 'type.googleapis.com/google.rpc.RetryInfo':
-                                retry_info = detail.get('retryDelay', '')
-                                if retry_info:
-                                    # Parse retry delay (format: "26s" or "26.400891299s")
-                                    retry_after = float(retry_info.rstrip('s')) + 1  # Add 1s buffer
-                                break
-                except:
-                    pass
-                
-                # Mark this key as rate-limited
-                key_manager.mark_key_rate_limited(api_key, retry_after)
-                
-                # Continue to next iteration to try another key
+            outcome = yield _Post(api_key)
+        except GeneratorExit:
+            # The caller gave up (e.g. cancelled) before the probe was answered
+            if probe:
+                breaker.abandon_probe()
+            raise
+        
+        if breaker is not None:
+            if isinstance(outcome, _TransportError) or outcome.status_code >= 500:
+                breaker.record_failure(probe)
+            elif outcome.status_code != 429 or probe:
+                breaker.record_success(probe)
+        # The breaker paces the retries of callers it paused, the others back off on their own
+        paced_by_breaker = probe or parked
+        
+        if isinstance(outcome, _TransportError):
+            if outcome.timeout:
+                print(f"⏱️  Request timeout. Retrying with next key ({attempt + 2}/{max_retries})...")
                 if attempt < max_retries - 1:
-                    print(f"🔄 Switching to next API key (attempt {attempt + 2}/{max_retries})...")
                     continue
                 else:
-                    raise Exception(f"All API keys exhausted after {max_retries} retries (rate limits)")
+                    raise Exception(f"API request timed out after {max_retries} retries")
             
-            # Server errors (503, 500, 502, 504) - retry with backoff
-            elif response.status_code >= 500:
+            print(f"🌐 Network error: {outcome.error}. Retrying ({attempt + 2}/{max_retries})...")
+            if attempt < max_retries - 1:
+                if not paced_by_breaker:
+                    yield _Sleep(base_retry_delay)
+                continue
+            else:
+                raise Exception(f"API request failed after {max_retries} retries: {outcome.error}")
+        
+        # Success - parse and return
+        if outcome.status_code == 200:
+            try:
+                return _extract_message_content(outcome.body)
+                
+            except (KeyError, IndexError, TypeError) as e:
+                print(f"❌ Error parsing response: {e}")
+                
+                # Retry with exponential backoff for parsing errors
                 if attempt < max_retries - 1:
-                    wait_time = base_retry_delay * (2 ** attempt)
+                    wait_time = min(base_retry_delay * (2 ** attempt), max_retry_delay)
                     jitter = random.uniform(0, wait_time * 0.2)
                     total_wait = wait_time + jitter
-                    print(f"❌ Server error ({response.status_code}), waiting {total_wait:.1f}s before retry {attempt + 2}/{max_retries}...")
-                    time.sleep(total_wait)
+                    print(f"🔄 Malformed response, waiting {total_wait:.1f}s before retry {attempt + 2}/{max_retries}...")
+                    yield _Sleep(total_wait)
                     continue
                 else:
-                    raise Exception(f"API request failed after {max_retries} retries (server error): {response.text}")
-            
-            # Client errors (4xx other than 429) - don't retry
-            else:
-                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+                    raise Exception(f"API response parsing failed after {max_retries} retries: {e}")
         
-        except requests.exceptions.Timeout:
-            print(f"⏱️  Request timeout. Retrying with next key ({attempt + 2}/{max_retries})...")
+        # Rate limit hit - mark key as rate-limited and try next key
+        elif outcome.status_code == 429:
+            # Try to extract retry-after time from response
+            retry_after = _parse_retry_after(outcome.body) if outcome.body else None
+            
+            # Mark this key as rate-limited
+            key_manager.mark_key_rate_limited(api_key, retry_after)
+            
+            # Continue to next iteration to try another key
             if attempt < max_retries - 1:
+                print(f"🔄 Switching to next API key (attempt {attempt + 2}/{max_retries})...")
                 continue
             else:
-                raise Exception(f"API request timed out after {max_retries} retries")
+                raise Exception(f"All API keys exhausted after {max_retries} retries (rate limits)")
         
-        except requests.exceptions.RequestException as e:
-            print(f"🌐 Network error: {e}. Retrying ({attempt + 2}/{max_retries})...")
-            if attempt < max_retries - 1:
-                time.sleep(base_retry_delay)
+        # Server errors (503, 500, 502, 504) - retry with backoff
+        elif outcome.status_code >= 500:
+            if attempt < max_retries - 1 and paced_by_breaker:
+                print(f"❌ Server error ({outcome.status_code}), retrying {attempt + 2}/{max_retries}...")
+                continue
+            elif attempt < max_retries - 1:
+                wait_time = min(base_retry_delay * (2 ** attempt), max_retry_delay)
+                jitter = random.uniform(0, wait_time * 0.2)
+                total_wait = wait_time + jitter
+                print(f"❌ Server error ({outcome.status_code}), waiting {total_wait:.1f}s before retry {attempt + 2}/{max_retries}...")
+                yield _Sleep(total_wait)
                 continue
             else:
-                raise Exception(f"API request failed after {max_retries} retries: {e}")
+                raise Exception(f"API request failed after {max_retries} retries (server error): {outcome.text}")
+        
+        # Client errors (4xx other than 429) - don't retry
+        else:
+            raise Exception(f"API request failed with status {outcome.status_code}: {outcome.text}")
     
     # Should not reach here, but just in case
     raise Exception(f"API request failed after {max_retries} retries")
 
+
+def _record_request(outcome, retry):
+    """Charge one request and its outcome to the active metrics spans."""
+    counts = {"requests": 1, "retries": int(retry)}
+    if isinstance(outcome, _TransportError):
+        counts["transport_errors"] = 1
+    elif outcome.status_code == 429:
+        counts["rate_limited"] = 1
+    elif outcome.status_code >= 500:
+        counts["server_errors"] = 1
+    elif outcome.status_code == 200 and isinstance(outcome.body, dict):
+        usage = outcome.body.get("usage")
+        if isinstance(usage, dict):
+            counts["prompt_tokens"] = usage.get("prompt_tokens") or 0
+            counts["completion_tokens"] = usage.get("completion_tokens") or 0
+    record(**counts)
+
+
+def _release_slot(limiter, started_at, outcome):
+    """Give back a limiter slot, reporting whether the outcome signals overload."""
+    if outcome is None:
+        overloaded = succeeded = False
+    elif isinstance(outcome, _TransportError):
+        overloaded, succeeded = outcome.timeout, False
+    else:
+        overloaded = outcome.status_code == 429 or outcome.status_code >= 500
+        succeeded = outcome.status_code == 200
+    limiter.release(started_at, overloaded=overloaded, succeeded=succeeded)
+
+
+_HTTP_BACKEND = HTTPBackend()
+
+
+def _send(session, base_url, api_key, payload, limiter=None, backend=_HTTP_BACKEND):
+    """Send one blocking request, holding a slot of the optional concurrency limiter."""
+    if limiter is None:
+        return backend.post(session, base_url, api_key, payload)
+    
+    started_at = limiter.acquire()
+    outcome = None
+    try:
+        outcome = backend.post(session, base_url, api_key, payload)
+    finally:
+        _release_slot(limiter, started_at, outcome)
+    return outcome
+
+
+def _settle_hedge(key_manager, api_key, outcome):
+    """Apply the rate limit of a hedged request to its key (the retry logic only sees the returned outcome)."""
+    if isinstance(outcome, _Response) and outcome.status_code == 429:
+        key_manager.mark_key_rate_limited(api_key, _parse_retry_after(outcome.body) if outcome.body else None)
+
+
+def _send_hedged(session, base_url, api_key, payload, limiter, backend, key_manager, hedging, estimated_tokens):
+    """
+    Send one blocking request, duplicating it on another key if it is slow.
+    
+    The first successful response wins. A blocking request cannot be
+    interrupted, so the losing one finishes in the background and only its
+    rate limit is applied to its key.
+    """
+    delay = hedging.start_request()
+    if delay is None:
+        started_at = time.time()
+        outcome = _send(session, base_url, api_key, payload, limiter, backend)
+        hedging.observe(outcome, time.time() - started_at)
+        return outcome
+    
+    started_at = time.time()
+    send = bind_context(_send)
+    primary = hedging.executor.submit(send, session, base_url, api_key, payload, limiter, backend)
+    done, _ = wait([primary], timeout=delay)
+    hedge_key = None
+    if not done:
+        hedge_key = hedging.hedge_key(key_manager, api_key, estimated_tokens)
+    if hedge_key is None:
+        outcome = primary.result()
+        hedging.observe(outcome, time.time() - started_at)
+        return outcome
+    
+    hedge_started_at = time.time()
+    hedge = hedging.executor.submit(send, session, base_url, hedge_key, payload, limiter, backend)
+    record(requests=1)
+    keys = {primary: api_key, hedge: hedge_key}
+    pending = {primary, hedge}
+    primary_outcome = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            outcome = future.result()
+            if future is hedge:
+                hedging.observe(outcome, time.time() - hedge_started_at)
+            else:
+                hedging.observe(outcome, time.time() - started_at)
+                primary_outcome = outcome
+            
+            if isinstance(outcome, _Response) and outcome.status_code == 200:
+                if future is hedge:
+                    hedging.hedge_won()
+                    if primary_outcome is not None:
+                        _settle_hedge(key_manager, api_key, primary_outcome)
+                for other in pending:
+                    if not other.cancel():
+                        other.add_done_callback(lambda loser: _settle_hedge(key_manager, keys[loser], loser.result()))
+                return outcome
+            if future is hedge:
+                _settle_hedge(key_manager, hedge_key, outcome)
+    
+    # Neither succeeded: let the retry logic handle the primary outcome
+    return primary_outcome
+
+
+def call_llm(model, user_prompt, key_manager, system_prompt=None, 
+             max_tokens=1000, temperature=0.2, base_url=None, session=None, limiter=None,
+             backend=None, hedging=None, breaker=None) -> str:
+    """
+    Call the language model API with automatic key rotation on rate limits.
+    
+    Args:
+        model: The model name to use
+        user_prompt: The user prompt to send
+        key_manager: APIKeyManager instance for handling multiple keys
+        system_prompt: Optional system prompt to set context
+        max_tokens: Maximum number of tokens to generate
+        temperature: Sampling temperature
+        base_url: The base URL for the API endpoint
+        session: Optional requests.Session to send through (the default shared pool otherwise)
+        limiter: Optional AdaptiveConcurrencyLimiter bounding in-flight requests
+        backend: Optional backend delivering the requests (HTTPBackend otherwise)
+        hedging: Optional HedgingPolicy duplicating slow requests on another key
+        breaker: Optional CircuitBreaker shared by all callers of the endpoint
+        
+    Returns:
+        The model's response as a string
+    """
+    payload = _build_payload(model, user_prompt, system_prompt, max_tokens, temperature)
+    estimated_tokens = estimate_tokens((system_prompt or "") + user_prompt)
+    steps = _call_llm_steps(key_manager, estimated_tokens, breaker=breaker)
+    if session is None:
+        session = get_http_session()
+    if backend is None:
+        backend = _HTTP_BACKEND
+    record(llm_calls=1)
+    
+    outcome = None
+    sent = False
+    try:
+        while True:
+            try:
+                step = steps.send(outcome)
+            except StopIteration as done:
+                return done.value
+            
+            if isinstance(step, _Sleep):
+                time.sleep(step.seconds)
+                outcome = None
+            elif isinstance(step, _Admit):
+                outcome = step.breaker.acquire()
+            else:
+                if hedging is None:
+                    outcome = _send(session, base_url, step.api_key, payload, limiter, backend)
+                else:
+                    outcome = _send_hedged(
+                        session, base_url, step.api_key, payload, limiter, backend,
+                        key_manager, hedging, estimated_tokens,
+                    )
+                _record_request(outcome, retry=sent)
+                sent = True
+    finally:
+        # Releases the circuit breaker probe if the request raised
+        steps.close()
+
+
+def _new_aiohttp_session(pool_size=16, keep_alive=True):
+    """Create a pooled aiohttp session, failing clearly if aiohttp is not installed."""
+    if aiohttp is None:
+        raise ImportError("Asynchronous LLM calls require aiohttp: pip install aiohttp")
+    connector = aiohttp.TCPConnector(limit_per_host=pool_size, force_close=not keep_alive)
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def _asend(session, base_url, api_key, payload, limiter=None, backend=_HTTP_BACKEND):
+    """Send one non-blocking request, holding a slot of the optional concurrency limiter."""
+    if limiter is None:
+        return await backend.apost(session, base_url, api_key, payload)
+    
+    started_at = await limiter.acquire_async()
+    outcome = None
+    try:
+        outcome = await backend.apost(session, base_url, api_key, payload)
+    finally:
+        _release_slot(limiter, started_at, outcome)
+    return outcome
+
+
+async def _asend_hedged(session, base_url, api_key, payload, limiter, backend, key_manager, hedging, estimated_tokens):
+    """
+    Send one non-blocking request, duplicating it on another key if it is slow.
+    
+    The first successful response wins and the other request is cancelled.
+    A failed primary is settled like a hedge when the hedge wins.
+    """
+    delay = hedging.start_request()
+    started_at = time.time()
+    primary = asyncio.ensure_future(_asend(session, base_url, api_key, payload, limiter, backend))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        hedge = hedge_key = None
+        if not done:
+            hedge_key = hedging.hedge_key(key_manager, api_key, estimated_tokens)
+        if hedge_key is not None:
+            hedge_started_at = time.time()
+            hedge = asyncio.ensure_future(_asend(session, base_url, hedge_key, payload, limiter, backend))
+            tasks.add(hedge)
+            record(requests=1)
+        
+        pending = set(tasks)
+        primary_outcome = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                if task is hedge:
+                    hedging.observe(outcome, time.time() - hedge_started_at)
+                else:
+                    hedging.observe(outcome, time.time() - started_at)
+                    primary_outcome = outcome
+                
+                if isinstance(outcome, _Response) and outcome.status_code == 200:
+                    if task is hedge:
+                        hedging.hedge_won()
+                        if primary_outcome is not None:
+                            _settle_hedge(key_manager, api_key, primary_outcome)
+                    return outcome
+                if task is hedge:
+                    _settle_hedge(key_manager, hedge_key, outcome)
+        
+        # Neither succeeded: let the retry logic handle the primary outcome
+        return primary_outcome
+    finally:
+        # Cancel the losing request (or both if the caller was cancelled)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def acall_llm(model, user_prompt, key_manager, system_prompt=None,
+                    max_tokens=1000, temperature=0.2, base_url=None, session=None, limiter=None,
+                    backend=None, hedging=None, breaker=None) -> str:
+    """
+    Asynchronous counterpart of call_llm with the same retry and key rotation semantics.
+    
+    Args:
+        model: The model name to use
+        user_prompt: The user prompt to send
+        key_manager: APIKeyManager instance for handling multiple keys
+        system_prompt: Optional system prompt to set context
+        max_tokens: Maximum number of tokens to generate
+        temperature: Sampling temperature
+        base_url: The base URL for the API endpoint
+        session: Optional aiohttp.ClientSession to reuse (a temporary one is created otherwise)
+        limiter: Optional AdaptiveConcurrencyLimiter bounding in-flight requests
+        backend: Optional backend delivering the requests (HTTPBackend otherwise)
+        hedging: Optional HedgingPolicy duplicating slow requests on another key
+        breaker: Optional CircuitBreaker shared by all callers of the endpoint
+        
+    Returns:
+        The model's response as a string
+    """
+    payload = _build_payload(model, user_prompt, system_prompt, max_tokens, temperature)
+    estimated_tokens = estimate_tokens((system_prompt or "") + user_prompt)
+    steps = _call_llm_steps(key_manager, estimated_tokens, breaker=breaker)
+    
+    if backend is None:
+        backend = _HTTP_BACKEND
+    record(llm_calls=1)
+    
+    owns_session = session is None
+    if owns_session:
+        session = _new_aiohttp_session()
+    
+    try:
+        outcome = None
+        sent = False
+        while True:
+            try:
+                step = steps.send(outcome)
+            except StopIteration as done:
+                return done.value
+            
+            if isinstance(step, _Sleep):
+                await asyncio.sleep(step.seconds)
+                outcome = None
+            elif isinstance(step, _Admit):
+                outcome = await step.breaker.acquire_async()
+            else:
+                if hedging is None:
+                    outcome = await _asend(session, base_url, step.api_key, payload, limiter, backend)
+                else:
+                    outcome = await _asend_hedged(
+                        session, base_url, step.api_key, payload, limiter, backend,
+                        key_manager, hedging, estimated_tokens,
+                    )
+                _record_request(outcome, retry=sent)
+                sent = True
+    finally:
+        # Releases the circuit breaker probe if the call was cancelled
+        steps.close()
+        if owns_session:
+            await session.close()
+
 def extract_json_from_text(text, verbose=True):
     """
     Extract JSON array from text that might contain additional content.
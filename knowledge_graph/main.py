@@ -8,19 +8,23 @@ import json
 import time
 import random
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add the parent directory to the Python path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from knowledge_graph.llm import LLM
+from knowledge_graph.llm import LLM, get_key_manager, get_response_cache, get_single_flight, get_circuit_breaker
 from knowledge_graph.config import load_config
 from knowledge_graph.visualization import visualize_knowledge_graph, sample_data_visualization
 from knowledge_graph.text_utils import chunk_text
+from knowledge_graph.checkpoint import ChunkCheckpoint
+from knowledge_graph.streaming import TripleStream
+from knowledge_graph.metrics import span, bind_context, get_recorder
 
+from knowledge_graph.predicates import normalize_predicates
 from knowledge_graph.entity_standardization import (
     standardize_entities,
     infer_relationships,
-    limit_predicate_length,
 )
 
 from knowledge_graph.prompts import (
@@ -41,6 +45,15 @@ from knowledge_graph.event_extraction import (
     infer_event_relationships               # Event inference
 )
 
+from knowledge_graph.event_prompts import (
+    # Within-chunk prompts (part of the chunk fingerprint)
+    EVENT_IDENTIFICATION_SYSTEM_PROMPT,
+    EVENT_ATTRIBUTE_SYSTEM_PROMPT,
+    EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT,
+    WITHIN_CHUNK_EVENT_RELATION_SYSTEM_PROMPT,
+    ENTITY_RELATION_SYSTEM_PROMPT,
+)
+
 def process_with_llm(config, input_text, debug=False):
     """
     Process input text with LLM to extract triples.
@@ -58,34 +71,35 @@ def process_with_llm(config, input_text, debug=False):
     llm = LLM(config)
     
     # Pre-KG resolution
-    prekg_text = llm(
-        PREKG_ENTITY_RESOLUTION_SYSTEM_PROMPT,
-        get_prekg_entity_resolution_user_prompt(input_text),
-    )
+    with span("prekg_resolution"):
+        prekg_text = llm(
+            PREKG_ENTITY_RESOLUTION_SYSTEM_PROMPT,
+            get_prekg_entity_resolution_user_prompt(input_text),
+        )
     
     # Claim extraction
-    text_claims = llm(
-        CLAIM_EXTRACTION_SYSTEM_PROMPT,
-        get_claim_extraction_user_prompt(prekg_text),
-    )
+    with span("claim_extraction"):
+        text_claims = llm(
+            CLAIM_EXTRACTION_SYSTEM_PROMPT,
+            get_claim_extraction_user_prompt(prekg_text),
+        )
     
     context_claims = text_claims.strip().split('\n')
     print(f"📝 Extracted {len([c for c in context_claims if c])} claims from chunk")
     
-    # FAST MODE: Không delay preventive, chỉ chờ khi gặp lỗi
-    # Delay tối thiểu để tránh spam
-    time.sleep(0.5)
-    
     # Within-chunk event processing
-    event_triples = get_events_from_claims(context_claims, config, debug)
-    event_triples += infer_within_chunk_event_relations(event_triples, config, debug)
+    with span("event_extraction"):
+        event_triples = get_events_from_claims(context_claims, config, debug)
+    with span("within_chunk_relations"):
+        event_triples += infer_within_chunk_event_relations(event_triples, config, debug)
     
     estats = get_event_stats(event_triples)
     print(f">> Extracted {estats['events']} events, {estats['participants']} entities, {estats['locations']} locations, and {estats['times']} time points.")
     
     # Connect entities from events
     print(f">> Extracting entity-entity relations from {estats['participants']} entities...")
-    entity_triples = get_entity_relations(prekg_text, event_triples, context_claims, config, debug)
+    with span("entity_relations"):
+        entity_triples = get_entity_relations(prekg_text, event_triples, context_claims, config, debug)
     print(f">> Extracted {len(entity_triples)} entity relations.")
 
     triples = event_triples + entity_triples
@@ -110,8 +124,7 @@ def process_with_llm(config, input_text, debug=False):
         return None
     
     # Apply predicate length limit to all valid triples
-    for triple in valid_triples:
-        triple["predicate"] = limit_predicate_length(triple["predicate"])
+    normalize_predicates(valid_triples)
     
     # Print extracted JSON only if debug mode is on
     if debug:
@@ -120,6 +133,94 @@ def process_with_llm(config, input_text, debug=False):
     
     return valid_triples
 
+def get_chunk_workers(config):
+    """
+    Get the number of chunks to process in parallel.
+    
+    Args:
+        config: Configuration dictionary
+        
+    Returns:
+        The configured number of workers, or the number of API keys if unset
+    """
+    workers = config.get("concurrency", {}).get("chunk_workers", 0)
+    if not workers or workers < 1:
+        workers = len(get_key_manager(config).api_keys)
+    return max(1, workers)
+
+def process_chunk(config, index, chunk, total_chunks, debug=False):
+    """
+    Process a single chunk and tag its triples with the chunk number.
+    
+    Args:
+        config: Configuration dictionary
+        index: Zero-based index of the chunk
+        chunk: Text of the chunk
+        total_chunks: Number of chunks in the document (for logging)
+        debug: If True, print detailed debug information
+        
+    Returns:
+        Tuple of (list of triples or None, processing time in seconds)
+    """
+    chunk_start = time.time()
+    print(f"\n{'='*50}")
+    print(f"📦 Processing chunk {index + 1}/{total_chunks} ({len(chunk.split())} words)")
+    print(f"{'='*50}")
+    
+    # Process the chunk with LLM
+    chunk_results = process_with_llm(config, chunk, debug)
+    
+    if chunk_results:
+        # Add chunk information to each triple
+        for item in chunk_results:
+            item["chunk"] = index + 1
+    
+    return chunk_results, time.time() - chunk_start
+
+def chunk_fingerprint(config, chunk):
+    """
+    Fingerprint a chunk for the checkpoint.
+    
+    Saved results are only reused while the chunk text, the model and the
+    extraction prompts and settings are the same.
+    """
+    return ChunkCheckpoint.fingerprint(
+        chunk,
+        config["llm"].get("model"),
+        PREKG_ENTITY_RESOLUTION_SYSTEM_PROMPT,
+        CLAIM_EXTRACTION_SYSTEM_PROMPT,
+        EVENT_IDENTIFICATION_SYSTEM_PROMPT,
+        EVENT_ATTRIBUTE_SYSTEM_PROMPT,
+        EVENT_EXTRACTION_BATCH_SYSTEM_PROMPT,
+        WITHIN_CHUNK_EVENT_RELATION_SYSTEM_PROMPT,
+        ENTITY_RELATION_SYSTEM_PROMPT,
+        config.get("extraction", {}),
+    )
+
+
+def _load_legacy_cumulative_output(input_name, next_chunk):
+    """
+    Load chunk results saved by older versions as cumulative JSON files.
+    
+    Args:
+        input_name: Name of the input file without extension
+        next_chunk: Next chunk to be processed
+        
+    Returns:
+        Dictionary mapping chunk number to its list of triples (empty if not found)
+    """
+    legacy_file = f"cumulative_output/{input_name}.chunk-1-to-{next_chunk - 1}.json"
+    if not os.path.exists(legacy_file):
+        return {}
+    
+    with open(legacy_file, "r", encoding="utf-8") as file:
+        triples = json.load(file)
+    
+    chunk_results_by_number = {}
+    for triple in triples:
+        chunk_results_by_number.setdefault(triple.get("chunk"), []).append(triple)
+    return chunk_results_by_number
+
 def process_text_in_chunks(config, full_text, debug=False):
     """
     Process a large text by breaking it into chunks with overlap,
@@ -147,63 +248,129 @@ def process_text_in_chunks(config, full_text, debug=False):
     print("PHASE 1: INITIAL EVENT-ENTITY TRIPLE EXTRACTION")
     print("=" * 50)
     print(f"Processing text in {len(text_chunks)} chunks ({chunking_info})")
-    print(f"⏱️  Estimated time: ~{len(text_chunks) * 2.5:.0f} minutes (due to API rate limits + server load)")
+    print("⏱️  The remaining time is estimated from the measured time of each finished chunk")
     print("⚠️  Note: Gemini API may be overloaded at peak hours, please be patient")
     print("=" * 50)
     
-    import time
     start_time = time.time()
     
-    # Process each chunk from specified index
-    next_chunk = config.get("next_chunk", 1)
-    os.makedirs("cumulative_output", exist_ok=True)
+    # Resume from the checkpoint of previous runs
     os.makedirs("output", exist_ok=True)
     input_name = config.get("input_name", "")
+    checkpoint = ChunkCheckpoint(f"cumulative_output/{input_name}.checkpoint.jsonl")
+    fingerprints = {i + 1: chunk_fingerprint(config, chunk) for i, chunk in enumerate(text_chunks)}
+    next_chunk = config.get("next_chunk")
     
     if next_chunk == 1:
-        all_results = []
+        # Explicit fresh start
+        checkpoint.reset()
+        chunk_results_by_number = {}
     else:
-        with open(f"cumulative_output/{input_name}.chunk-1-to-{next_chunk - 1}.json", "r", encoding="utf-8") as file:
-            all_results = json.load(file)
-    
-    for i, chunk in enumerate(text_chunks):
-        chunk_start = time.time()
-        print(f"\n{'='*50}")
-        print(f"📦 Processing chunk {i + 1}/{len(text_chunks)} ({len(chunk.split())} words)")
-        print(f"{'='*50}")
-        
-        if i + 1 < next_chunk:
-            continue
-        
-        # Process the chunk with LLM
-        chunk_results = process_with_llm(config, chunk, debug)
+        chunk_results_by_number = checkpoint.load(fingerprints)
+    
+    if next_chunk is None:
+        # Auto-detect: process every chunk missing from the checkpoint
+        done_numbers = set(chunk_results_by_number)
+    else:
+        # Chunks before next_chunk are kept, the following ones are processed again
+        chunk_results_by_number = {n: r for n, r in chunk_results_by_number.items() if n < next_chunk}
+        if next_chunk > 1 and len(chunk_results_by_number) < next_chunk - 1:
+            legacy_results = _load_legacy_cumulative_output(input_name, next_chunk)
+            chunk_results_by_number.update({
+                n: r for n, r in legacy_results.items()
+                if n not in chunk_results_by_number and n not in checkpoint.stale_chunks
+            })
+        # Chunks before next_chunk without saved results (or stale ones) are processed again as well
+        done_numbers = set(chunk_results_by_number)
+        missing = next_chunk - 1 - len(done_numbers)
+        if missing > 0:
+            print(f"⚠️  {missing} chunk(s) before chunk {next_chunk} have no saved results and will be processed again")
+    
+    if chunk_results_by_number:
+        print(f"♻️  Resuming from checkpoint: {len(chunk_results_by_number)} chunk(s) already processed")
+    
+    # Stream triples as soon as their chunk is done, starting with the resumed chunks
+    stream = None
+    if config.get("output", {}).get("stream", False):
+        stream = TripleStream(f"{input_name}.stream.jsonl")
+        for number in sorted(chunk_results_by_number):
+            stream.chunk(number, chunk_results_by_number[number])
+        print(f"📤 Streaming triples to {stream.path}")
+    
+    pending_chunks = [(i, chunk) for i, chunk in enumerate(text_chunks) if i + 1 not in done_numbers]
+    workers = min(get_chunk_workers(config), max(1, len(pending_chunks)))
+    print(f"🧵 Processing {len(pending_chunks)} chunk(s) with {workers} worker(s)")
+    
+    done_chunks = 0
+    
+    def record_chunk(i, chunk_results, chunk_time):
+        nonlocal done_chunks
+        done_chunks += 1
         
         if chunk_results:
-            # Add chunk information to each triple
-            for item in chunk_results:
-                item["chunk"] = i + 1
-            
-            # Add to overall results
             with open(f"output/{input_name}.chunk-{i + 1}.json", "w", encoding="utf-8") as file:
                 json.dump(chunk_results, file, indent=2, ensure_ascii=False)
-            all_results.extend(chunk_results)
+            checkpoint.append(i + 1, chunk_results, fingerprints[i + 1])
+            chunk_results_by_number[i + 1] = chunk_results
+            if stream is not None:
+                stream.chunk(i + 1, chunk_results)
             
-            chunk_time = time.time() - chunk_start
+            # Chunks finish in parallel, so the elapsed time per finished chunk already accounts for the workers
             elapsed_time = time.time() - start_time
-            avg_time_per_chunk = elapsed_time / (i + 1)
-            remaining_chunks = len(text_chunks) - (i + 1)
+            avg_time_per_chunk = elapsed_time / done_chunks
+            remaining_chunks = len(pending_chunks) - done_chunks
             eta = avg_time_per_chunk * remaining_chunks
             
             print(f"✅ Chunk {i + 1} completed: {len(chunk_results)} triples extracted")
             print(f"⏱️  Chunk time: {chunk_time:.1f}s | Total elapsed: {elapsed_time/60:.1f}m | ETA: {eta/60:.1f}m")
-            
-            with open(f"cumulative_output/{input_name}.chunk-1-to-{i + 1}.json", "w", encoding="utf-8") as file:
-                json.dump(all_results, file, indent=2, ensure_ascii=False)
         else:
             print(f"⚠️  Warning: Failed to extract triples from chunk {i + 1}")
     
+    with span("extraction"):
+        if workers == 1:
+            for i, chunk in pending_chunks:
+                chunk_results, chunk_time = process_chunk(config, i, chunk, len(text_chunks), debug)
+                record_chunk(i, chunk_results, chunk_time)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(bind_context(process_chunk), config, i, chunk, len(text_chunks), debug): i
+                    for i, chunk in pending_chunks
+                }
+                try:
+                    for future in as_completed(futures):
+                        chunk_results, chunk_time = future.result()
+                        record_chunk(futures[future], chunk_results, chunk_time)
+                except BaseException:
+                    # Do not start new chunks once one has failed; finished chunks are already saved
+                    for future in futures:
+                        future.cancel()
+                    raise
+    
+    # Add to overall results in chunk order
+    all_results = [
+        triple
+        for number in sorted(chunk_results_by_number)
+        for triple in chunk_results_by_number[number]
+    ]
+    
     print(f"\nExtracted a total of {len(all_results)} triples from all chunks")
     
+    cache = get_response_cache(config)
+    if cache is not None:
+        cache_stats = cache.get_statistics()
+        print(f"💾 LLM response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['size_mb']:.1f} MB stored)")
+    
+    single_flight = get_single_flight(config)
+    if single_flight is not None:
+        flight_stats = single_flight.get_statistics()
+        print(f"🔗 Request coalescing: {flight_stats['hits']} duplicate in-flight requests shared, {flight_stats['misses']} sent")
+    
+    breaker = get_circuit_breaker(config)
+    if breaker is not None and breaker.get_statistics()['trips']:
+        breaker_stats = breaker.get_statistics()
+        print(f"🔌 Circuit breaker: opened {breaker_stats['trips']} time(s), {breaker_stats['parked']} calls paused")
+    
     # Apply entity standardization if enabled
     if config.get("standardization", {}).get("enabled", False):
         print("Standardization is enabled", config.get("standardization", {}).get("enabled", False))
@@ -212,14 +379,22 @@ def process_text_in_chunks(config, full_text, debug=False):
         print("PHASE 2A: EVENT STANDARDIZATION")
         print("="*50)
         print(f"Starting with {len(all_results)} triples and {len(get_unique_entities(all_results))} unique names")
-        all_results = resolve_events_with_llm(all_results, config)
+        snapshot = stream.snapshot(all_results) if stream is not None else None
+        with span("event_standardization"):
+            all_results = resolve_events_with_llm(all_results, config, stream=stream)
+        if stream is not None:
+            stream.stage_done("event_standardization", snapshot, all_results)
         print(f"After standardization: {len(all_results)} triples and {len(get_unique_entities(all_results))} unique names")
         
         print("\n" + "="*50)
         print("PHASE 2B: ENTITY STANDARDIZATION")
         print("="*50)
         print(f"Starting with {len(all_results)} triples and {len(get_unique_entities(all_results))} unique names")
-        all_results = standardize_entities(all_results, config)
+        snapshot = stream.snapshot(all_results) if stream is not None else None
+        with span("entity_standardization"):
+            all_results = standardize_entities(all_results, config, stream=stream)
+        if stream is not None:
+            stream.stage_done("entity_standardization", snapshot, all_results)
         print(f"After standardization: {len(all_results)} triples and {len(get_unique_entities(all_results))} unique names")
     
     # Apply relationship inference if enabled
@@ -240,7 +415,11 @@ def process_text_in_chunks(config, full_text, debug=False):
         for pred, count in sorted(relationship_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
             print(f" - {pred}: {count} occurrences")
         
-        all_results = infer_event_relationships(all_results, config)
+        snapshot = stream.snapshot(all_results) if stream is not None else None
+        with span("event_inference"):
+            all_results = infer_event_relationships(all_results, config)
+        if stream is not None:
+            stream.stage_done("event_inference", snapshot, all_results)
         
         # Count relationships after inference
         relationship_counts_after = {}
@@ -270,7 +449,11 @@ def process_text_in_chunks(config, full_text, debug=False):
         for pred, count in sorted(relationship_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
             print(f" - {pred}: {count} occurrences")
         
-        all_results = infer_relationships(all_results, config)
+        snapshot = stream.snapshot(all_results) if stream is not None else None
+        with span("entity_inference"):
+            all_results = infer_relationships(all_results, config)
+        if stream is not None:
+            stream.stage_done("entity_inference", snapshot, all_results)
         
         # Count relationships after inference
         relationship_counts_after = {}
@@ -286,6 +469,9 @@ def process_text_in_chunks(config, full_text, debug=False):
         print(f"\nAdded {inferred_count} inferred relationships")
         print(f"Final knowledge graph: {len(all_results)} triples")
     
+    if stream is not None:
+        stream.close(len(all_results))
+    
     return all_results
 
 def get_unique_entities(triples):
@@ -319,7 +505,11 @@ def main():
     parser.add_argument('--debug', action='store_true', help='Enable debug output (raw LLM responses and extracted JSON)')
     parser.add_argument('--no-standardize', action='store_true', help='Disable entity standardization')
     parser.add_argument('--no-inference', action='store_true', help='Disable relationship inference')
-    parser.add_argument('-n', '--next-chunk', type=int, default=1, help="Next chunk to be processed")
+    parser.add_argument('-n', '--next-chunk', type=int, default=None, help="Next chunk to be processed (default: resume after the chunks saved in the checkpoint, 1 = start over)")
+    parser.add_argument('--no-cache', action='store_true', help='Disable the LLM response cache')
+    parser.add_argument('--refresh-cache', action='store_true', help='Ignore cached LLM responses and store fresh ones')
+    parser.add_argument('--stream', action='store_true', help='Stream triples to <input>.stream.jsonl as chunks finish')
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Number of chunks processed in parallel (default: number of API keys)")
     
     args = parser.parse_args()
     
@@ -329,6 +519,8 @@ def main():
         print(f"Failed to load configuration from {args.config}. Exiting.")
         return
     config["next_chunk"] = args.next_chunk
+    if args.workers is not None:
+        config.setdefault("concurrency", {})["chunk_workers"] = args.workers
     
     # If test flag is provided, generate a sample visualization
     if args.test:
@@ -354,6 +546,12 @@ def main():
         config.setdefault("standardization", {})["enabled"] = False
     if args.no_inference:
         config.setdefault("inference", {})["enabled"] = False
+    if args.no_cache:
+        config.setdefault("cache", {})["enabled"] = False
+    if args.refresh_cache:
+        config.setdefault("cache", {})["refresh"] = True
+    if args.stream:
+        config.setdefault("output", {})["stream"] = True
     
     # Load input text from file
     try:
@@ -364,28 +562,54 @@ def main():
         print(f"Error reading input file {args.input}: {e}")
         return
 
-    result = process_text_in_chunks(config, input_text, args.debug)
+    try:
+        result = process_text_in_chunks(config, input_text, args.debug)
     
-    # Visualize the knowledge graph
-    html_output = config["input_name"] + ".html"
+        # Visualize the knowledge graph
+        html_output = config["input_name"] + ".html"
     
-    # print(json.dumps(result, indent=2, ensure_ascii=False))
+        # print(json.dumps(result, indent=2, ensure_ascii=False))
     
-    stats = visualize_knowledge_graph(result, html_output, config=config)
-    print("\nKnowledge Graph Statistics:")
-    print(f"Nodes: {stats['nodes']}")
-    print(f"Edges: {stats['edges']}")
-    print(f"Communities: {stats['communities']}")
+        with span("visualization"):
+            stats = visualize_knowledge_graph(result, html_output, config=config)
+        print("\nKnowledge Graph Statistics:")
+        print(f"Nodes: {stats['nodes']}")
+        print(f"Edges: {stats['edges']}")
+        print(f"Communities: {stats['communities']}")
     
-    # # Provide command to open the visualization in a browser
-    print("\nTo view the visualization, open the following file in your browser:")
-    print(f"file://{os.path.abspath(html_output)}".replace('\\', '/'))
+        # # Provide command to open the visualization in a browser
+        print("\nTo view the visualization, open the following file in your browser:")
+        print(f"file://{os.path.abspath(html_output)}".replace('\\', '/'))
     
-    out_name = config["input_name"] + ".json"
+        out_name = config["input_name"] + ".json"
     
-    with open(out_name, "w", encoding="utf-8") as file:
-        json.dump(result, file, indent=2, ensure_ascii=False)
-    print(f"Stored JSON objects at: {out_name}")
+        with open(out_name, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+        print(f"Stored JSON objects at: {out_name}")
+    finally:
+        # Also keep the telemetry of failed or interrupted runs
+        if config.get("metrics", {}).get("enabled", True):
+            write_run_report(config)
+
+
+def write_run_report(config):
+    """Print the per-stage statistics and store the run report next to the outputs."""
+    recorder = get_recorder()
+    report = recorder.report()
+    
+    print("\nRun statistics (stage: wall time, requests, retries, 429s, prompt/completion tokens):")
+    for stage in report["spans"]:
+        # Sub-stages follow their stage, indented under it
+        *parents, name = stage["span"].split("/")
+        print(f" {'  ' * len(parents)}- {name}: {stage['seconds']:.1f}s, {stage['requests']} requests, "
+              f"{stage['retries']} retries, {stage['rate_limited']} 429s, "
+              f"{stage['prompt_tokens']}/{stage['completion_tokens']} tokens")
+    
+    json_path, prometheus_path = recorder.write(
+        config["input_name"],
+        keys=get_key_manager(config).get_statistics(),
+    )
+    print(f"Stored run report at: {json_path} and {prometheus_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+"""Per-stage timing, request and token instrumentation of the pipeline.
+
+Stages are wrapped in spans:
+
+    with span("claim_extraction"):
+        text_claims = llm(...)
+
+Spans nest through a context variable, so a span opened inside another one
+is reported under its path ("extraction/claim_extraction"), and the LLM client
+charges its requests, retries, rate limits and tokens to every active span.
+Context variables do not follow work handed to thread pools by themselves:
+wrap the submitted function with bind_context().
+"""
+import json
+import time
+import contextvars
+from threading import Lock
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Counters charged to the active spans
+COUNTERS = (
+    "llm_calls",            # LLM calls not answered by the response cache
+    "requests",             # HTTP requests sent, including retries
+    "retries",              # Requests after the first one of a call
+    "rate_limited",         # 429 responses
+    "server_errors",        # 5xx responses
+    "transport_errors",     # Timeouts and network errors
+    "prompt_tokens",        # From the "usage" field of the responses
+    "completion_tokens",
+    "cache_hits",           # LLM calls answered by the response cache
+    "coalesced",            # LLM calls that shared an identical in-flight request
+    "hedges",               # Duplicate requests sent on another key for slow requests
+    "hedge_wins",           # Hedges that answered before the request they duplicated
+    "circuit_parked",       # LLM calls paused by the open circuit breaker
+)
+
+_span_paths = contextvars.ContextVar("knowledge_graph_span_paths", default=())
+
+
+class SpanStats:
+    """Accumulated statistics of every run of one span path."""
+    
+    __slots__ = ("path", "calls", "seconds", "counters")
+    
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.seconds = 0.0
+        self.counters = defaultdict(int)
+    
+    def to_dict(self):
+        return {
+            "span": self.path,
+            "calls": self.calls,
+            "seconds": round(self.seconds, 3),
+            **{name: self.counters[name] for name in COUNTERS},
+        }
+
+
+class MetricsRecorder:
+    """Thread-safe collector of span timings and counters."""
+    
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+    
+    def reset(self):
+        """Forget all statistics and restart the run clock."""
+        with self._lock:
+            self.spans = {}
+            self.totals = defaultdict(int)
+            self.started_at = time.time()
+    
+    @contextmanager
+    def span(self, name):
+        """Time a stage and charge the counters recorded inside it."""
+        paths = _span_paths.get()
+        path = f"{paths[-1]}/{name}" if paths else name
+        token = _span_paths.set(paths + (path,))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _span_paths.reset(token)
+            with self._lock:
+                stats = self.spans.get(path)
+                if stats is None:
+                    stats = self.spans[path] = SpanStats(path)
+                stats.calls += 1
+                stats.seconds += elapsed
+    
+    def record(self, **counts):
+        """Add to counters of the run and of every active span."""
+        paths = _span_paths.get()
+        with self._lock:
+            for name, value in counts.items():
+                if not value:
+                    continue
+                self.totals[name] += value
+                for path in paths:
+                    stats = self.spans.get(path)
+                    if stats is None:
+                        stats = self.spans[path] = SpanStats(path)
+                    stats.counters[name] += value
+    
+    def report(self, **extra):
+        """
+        Get the run report.
+        
+        Args:
+            **extra: Additional top-level fields (e.g. API key statistics)
+        
+        Returns:
+            Dictionary with the run totals and one entry per span path
+        """
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": round(time.time() - self.started_at, 3),
+                "totals": {name: self.totals[name] for name in COUNTERS},
+                "spans": [stats.to_dict() for stats in sorted(self.spans.values(), key=lambda stats: stats.path)],
+                **extra,
+            }
+    
+    def prometheus(self):
+        """Get the statistics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            "# HELP knowledge_graph_run_seconds Wall time since the run started",
+            "# TYPE knowledge_graph_run_seconds gauge",
+            f"knowledge_graph_run_seconds {report['wall_seconds']}",
+            "# HELP knowledge_graph_span_calls_total Number of times a pipeline span ran",
+            "# TYPE knowledge_graph_span_calls_total counter",
+        ]
+        lines += [f'knowledge_graph_span_calls_total{{span="{span["span"]}"}} {span["calls"]}' for span in report["spans"]]
+        lines += [
+            "# HELP knowledge_graph_span_seconds_total Wall time spent in a pipeline span (summed over parallel runs)",
+            "# TYPE knowledge_graph_span_seconds_total counter",
+        ]
+        lines += [f'knowledge_graph_span_seconds_total{{span="{span["span"]}"}} {span["seconds"]}' for span in report["spans"]]
+        
+        for name in COUNTERS:
+            metric = f"knowledge_graph_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{span="total"}} {report["totals"][name]}')
+            lines += [f'{metric}{{span="{span["span"]}"}} {span[name]}' for span in report["spans"]]
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path_prefix, **extra):
+        """
+        Write the run report to <path_prefix>.metrics.json and .metrics.prom.
+        
+        Returns:
+            Paths of the two files
+        """
+        json_path = f"{path_prefix}.metrics.json"
+        prometheus_path = f"{path_prefix}.metrics.prom"
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(self.report(**extra), file, indent=2, ensure_ascii=False)
+        with open(prometheus_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        return json_path, prometheus_path
+
+
+_recorder = MetricsRecorder()
+
+
+def get_recorder():
+    """Get the process-wide metrics recorder."""
+    return _recorder
+
+
+def span(name):
+    """Time a stage on the process-wide recorder (see MetricsRecorder.span)."""
+    return _recorder.span(name)
+
+
+def record(**counts):
+    """Add to counters of the process-wide recorder (see MetricsRecorder.record)."""
+    _recorder.record(**counts)
+
+
+def bind_context(fn):
+    """
+    Run fn in the spans active at wrapping time, from any thread.
+    
+    Every call runs in its own copy of the captured context, so the wrapper can
+    be handed to ThreadPoolExecutor.submit or map and called concurrently.
+    """
+    context = contextvars.copy_context()
+    
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
@@ -0,0 +1,64 @@
+"""Predicate normalization for knowledge graph triples."""
+import os
+from functools import lru_cache
+
+STOPWORDS_PATH = os.path.join(os.path.dirname(__file__), 'vietnamese-stopwords.txt')
+
+
+@lru_cache(maxsize=1)
+def load_stopwords(path=STOPWORDS_PATH):
+    """
+    Load the Vietnamese stopword list once.
+    
+    Args:
+        path: Stopword file with one word or phrase per line (default: the one shipped with the package)
+        
+    Returns:
+        Frozenset of lowercase stopwords
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return frozenset(line.strip().lower() for line in file if line.strip())
+
+
+@lru_cache(maxsize=65536)
+def limit_predicate_length(predicate, max_words=6):
+    """
+    Enforce a maximum word limit on predicates.
+    
+    Args:
+        predicate: The original predicate string
+        max_words: Maximum number of words allowed (default: 6)
+        
+    Returns:
+        Shortened predicate with no more than max_words
+    """
+    words = predicate.split()
+    if len(words) <= max_words:
+        return predicate
+    
+    # If too long, use only the first max_words words
+    words = words[:max_words]
+    
+    # Remove trailing prepositions or articles if they're the last word
+    if words[-1].lower() in load_stopwords() and len(words) > 1:
+        words = words[:-1]
+    
+    return ' '.join(words)
+
+
+def normalize_predicates(triples, max_words=6):
+    """
+    Enforce the predicate word limit on a whole list of triples in place.
+    
+    Args:
+        triples: List of dictionaries with a 'predicate' key
+        max_words: Maximum number of words allowed (default: 6)
+        
+    Returns:
+        The same list of triples
+    """
+    for triple in triples:
+        predicate = triple["predicate"]
+        if isinstance(predicate, str):
+            triple["predicate"] = limit_predicate_length(predicate, max_words)
+    return triples
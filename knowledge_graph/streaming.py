@@ -0,0 +1,115 @@
+"""Streaming JSONL output of triples and of the changes made by later stages."""
+import os
+import json
+import threading
+from collections import Counter
+
+
+def _triple_key(triple):
+    return (triple["subject"], triple["predicate"], triple["object"])
+
+
+class TripleStream:
+    """
+    JSONL sink that receives triples as soon as their chunk is extracted.
+    
+    Records, one JSON object per line:
+        {"type": "triple", "chunk": n, "triple": {...}}          extracted triple
+        {"type": "rename", "stage": s, "from": a, "to": b}       node renamed by a stage
+        {"type": "remove", "stage": s, "triple": {s, p, o}}      triple dropped by a stage
+        {"type": "add", "stage": s, "triple": {...}}             triple added by a stage
+        {"type": "end", "triples": n}                            the run is complete
+    
+    Applying the records in order (renames to every known triple, then removals
+    and additions) reproduces the final list of triples, so consumers can start
+    ingesting before the run finishes.
+    """
+    
+    def __init__(self, path):
+        """
+        Initialize the stream, truncating any previous one.
+        
+        Args:
+            path: Path of the JSONL stream file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._renames = []
+    
+    def _write(self, records):
+        with self._lock:
+            for record in records:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+    
+    def chunk(self, number, triples):
+        """Write the triples of a finished chunk."""
+        self._write({"type": "triple", "chunk": number, "triple": triple} for triple in triples)
+    
+    def rename_nodes(self, stage, renames):
+        """
+        Write the node renames applied by a stage.
+        
+        Args:
+            stage: Stage name
+            renames: Dictionary mapping old node names to new ones
+        """
+        renames = {old: new for old, new in renames.items() if old != new}
+        if renames:
+            self._renames.append(renames)
+            self._write(
+                {"type": "rename", "stage": stage, "from": old, "to": new}
+                for old, new in renames.items()
+            )
+    
+    def snapshot(self, triples):
+        """
+        Remember the triples before a stage runs.
+        
+        Returns:
+            Snapshot to pass to stage_done()
+        """
+        self._renames = []
+        return [_triple_key(triple) for triple in triples]
+    
+    def stage_done(self, stage, snapshot, triples):
+        """
+        Write the triples a stage removed and added, besides its renames.
+        
+        Args:
+            stage: Stage name
+            snapshot: Result of snapshot() before the stage
+            triples: Triples after the stage
+        """
+        # Apply the stage's renames to the previous triples first
+        for renames in self._renames:
+            snapshot = [
+                (renames.get(subject, subject), predicate, renames.get(obj, obj))
+                for subject, predicate, obj in snapshot
+            ]
+        self._renames = []
+        
+        before = Counter(snapshot)
+        after = Counter(_triple_key(triple) for triple in triples)
+        
+        records = []
+        for key, count in (before - after).items():
+            subject, predicate, obj = key
+            records.extend([{"type": "remove", "stage": stage, "triple": {"subject": subject, "predicate": predicate, "object": obj}}] * count)
+        
+        extra = after - before
+        for triple in triples:
+            key = _triple_key(triple)
+            if extra[key] > 0:
+                extra[key] -= 1
+                records.append({"type": "add", "stage": stage, "triple": triple})
+        self._write(records)
+    
+    def close(self, total=None):
+        """Write the end record and close the stream."""
+        self._write([{"type": "end", "triples": total}])
+        self._file.close()
@@ -0,0 +1,86 @@
+// Level-of-detail viewer: the page starts with one node per community and
+// double-clicking a community loads its nodes and edges from a sidecar JSON file.
+var communityDirectory = "{{ community_directory }}";
+var expandedCommunities = {};
+
+function communityNodeId(community) {
+    return "community:" + community;
+}
+
+function addCommunityData(community, data) {
+    const communityId = communityNodeId(community);
+    const center = network.getPositions([communityId])[communityId] || {x: 0, y: 0};
+
+    // Replace the community node (and its overview edges) by its members
+    const overviewEdges = edges.get({filter: edge => edge.from === communityId || edge.to === communityId});
+    edges.remove(overviewEdges.map(edge => edge.id));
+    nodes.remove(communityId);
+
+    const spread = 20 * Math.sqrt(data.nodes.length) + 50;
+    data.nodes.forEach(node => {
+        if (node.x === undefined) {
+            node.x = center.x + (Math.random() - 0.5) * spread;
+            node.y = center.y + (Math.random() - 0.5) * spread;
+        }
+    });
+    nodes.add(data.nodes);
+    edges.add(data.edges);
+
+    // Edges leaving the community go to the member nodes of expanded communities
+    // and are bundled into one edge per member for collapsed ones
+    const bundles = {};
+    data.external.forEach(link => {
+        if (expandedCommunities[link.otherCommunity] === true) {
+            edges.add(link.edge);
+            return;
+        }
+        const otherId = communityNodeId(link.otherCommunity);
+        const fromOther = link.otherEnd === "from";
+        const member = fromOther ? link.edge.to : link.edge.from;
+        const key = (fromOther ? otherId + "->" + member : member + "->" + otherId);
+        if (!bundles[key]) {
+            bundles[key] = {from: fromOther ? otherId : member, to: fromOther ? member : otherId, arrows: "to", count: 0};
+        }
+        bundles[key].count += 1;
+    });
+    edges.add(Object.values(bundles).map(bundle => ({
+        from: bundle.from,
+        to: bundle.to,
+        arrows: bundle.arrows,
+        label: String(bundle.count),
+        title: bundle.count + " relationships",
+        dashes: true
+    })));
+
+    allNodes = nodes.get({ returnType: "Object" });
+    allEdges = edges.get({ returnType: "Object" });
+    data.nodes.forEach(node => { nodeColors[node.id] = node.color; });
+}
+
+function expandCommunity(community) {
+    if (expandedCommunities[community]) return;
+    expandedCommunities[community] = "loading";
+
+    fetch(communityDirectory + "/community_" + community + ".json")
+        .then(response => {
+            if (!response.ok) throw new Error(response.status + " " + response.statusText);
+            return response.json();
+        })
+        .then(data => {
+            expandedCommunities[community] = true;
+            addCommunityData(community, data);
+        })
+        .catch(error => {
+            delete expandedCommunities[community];
+            alert("Could not load community " + community + " (" + error + ").\n" +
+                  "Browsers block local files: serve this folder over HTTP, e.g. with `python -m http.server`.");
+        });
+}
+
+network.on("doubleClick", function(params) {
+    params.nodes.forEach(nodeId => {
+        if (typeof nodeId === "string" && nodeId.startsWith("community:")) {
+            expandCommunity(nodeId.slice("community:".length));
+        }
+    });
+});
@@ -14,6 +14,18 @@ def chunk_text(text, config):
     chunks = [chunk.strip() for chunk in chunks if chunk.strip()]
     return chunks
 
+def estimate_tokens(text):
+    """
+    Roughly estimate the number of LLM tokens in a text (about 4 characters per token).
+    
+    Args:
+        text: The text to measure
+        
+    Returns:
+        Estimated number of tokens
+    """
+    return len(text) // 4
+
 def default_chunk_text(text, config):
     """
     Split a text into chunks of words with overlap.
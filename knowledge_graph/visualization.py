@@ -3,7 +3,9 @@ import networkx as nx
 import json
 import re
 import os
+import multiprocessing
 from pyvis.network import Network
+from knowledge_graph.layout import force_layout
 
 # HTML template for visualization is now stored in a separate file
 def _load_html_template():
@@ -31,9 +33,11 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
     Returns:
         Dictionary with graph statistics
     """
+    visualization_config = (config or {}).get("visualization", {})
+    
     # Determine edge smoothing from config if not explicitly provided
     if edge_smooth is None and config is not None:
-        edge_smooth = config.get("visualization", {}).get("edge_smooth", False)
+        edge_smooth = visualization_config.get("edge_smooth", False)
     elif edge_smooth is None:
         edge_smooth = False
     
@@ -43,9 +47,6 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
         
     print(f"Processing {len(triples)} triples for visualization")
     
-    # Create a directed graph
-    G = nx.DiGraph()
-    
     # Dictionary to store node groups for community visualization
     node_communities = {}
     
@@ -77,7 +78,7 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
             G_undirected.add_edge(triple["subject"], triple["object"])
     
     # Calculate centrality metrics
-    centrality_metrics = _calculate_centrality_metrics(G_undirected, all_nodes)
+    centrality_metrics = _calculate_centrality_metrics(G_undirected, all_nodes, visualization_config)
     betweenness = centrality_metrics["betweenness"]
     degree = centrality_metrics["degree"]
     eigenvector = centrality_metrics["eigenvector"]
@@ -91,6 +92,50 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
     # Calculate node sizes based on centrality metrics
     node_sizes = _calculate_node_sizes(all_nodes, betweenness, degree, eigenvector)
     
+    # Set visualization options
+    options = _get_visualization_options(edge_smooth)
+    
+    # Optionally lay the graph out here so the browser does not have to simulate physics
+    positions = None
+    if visualization_config.get("layout", "browser") == "precomputed":
+        print("Computing the graph layout...")
+        positions = force_layout(
+            sorted(node for node in all_nodes if node),
+            G_undirected.edges(),
+            iterations=visualization_config.get("layout_iterations", 100),
+        )
+        options["physics"]["enabled"] = False
+        options["layout"]["improvedLayout"] = False
+    
+    title = f"Knowledge Graph - {len(all_nodes)} Nodes, {len(triples)} Relationships, {community_count} Communities"
+    if visualization_config.get("viewer", "full") == "communities":
+        # Overview of the communities, each one loaded from its own file when expanded
+        _write_community_viewer(output_file, title, triples, all_nodes, node_communities, node_sizes, degree, colors, options, positions)
+    elif visualization_config.get("renderer", "direct") == "pyvis":
+        _render_with_pyvis(triples, all_nodes, node_communities, community_count, node_sizes, degree, colors, options, output_file, positions)
+    else:
+        # Stream nodes and edges straight into the vis.js page
+        nodes = _iter_vis_nodes(all_nodes, node_communities, node_sizes, degree, colors, positions)
+        edges = _iter_vis_edges(triples)
+        _write_vis_html(output_file, title, nodes, edges, options)
+    
+    # Return statistics
+    original_edges = len(triples) - len(inferred_edges)
+    stats = {
+        "nodes": len(all_nodes),
+        "edges": len(triples),
+        "original_edges": original_edges,
+        "inferred_edges": len(inferred_edges),
+        "communities": len(set(node_communities.values()))
+    }
+    print(f"Graph Statistics: {json.dumps(stats, indent=2)}")
+    return stats
+
+def _render_with_pyvis(triples, all_nodes, node_communities, community_count, node_sizes, degree, colors, options, output_file, positions=None):
+    """Render the graph through NetworkX and PyVis (the renderer = "pyvis" option)."""
+    # Create a directed graph
+    G = nx.DiGraph()
+    
     # Add nodes to the graph with community colors and sizes
     for node in all_nodes:
         if not node:
@@ -103,6 +148,8 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
             title=f"{node} - Connections: {degree.get(node, 0)}",  # Simple tooltip without HTML tags
             size=node_sizes[node]
         )
+        if positions:
+            G.nodes[node]["x"], G.nodes[node]["y"] = positions[node]
     
     # Add edges with predicates as labels
     for triple in triples:
@@ -146,36 +193,86 @@ def visualize_knowledge_graph(triples, output_file="knowledge_graph.html", edge_
     # Add nodes and edges from NetworkX graph - do this explicitly for better control
     _add_nodes_and_edges_to_network(net, G)
     
-    # Set visualization options
-    options = _get_visualization_options(edge_smooth)
-    
     # Set all options in one go with proper JSON
     net.set_options(json.dumps(options))
     
     
     # Save the network as HTML and modify with custom template
     _save_and_modify_html(net, output_file, community_count, all_nodes, triples)
+
+# Graph shared with the betweenness worker processes
+_betweenness_graph = None
+
+def _init_betweenness_worker(graph):
+    """Keep the graph in the worker process so it is sent only once."""
+    global _betweenness_graph
+    _betweenness_graph = graph
+
+def _betweenness_from_sources(sources):
+    """Unnormalized betweenness contributions of the shortest paths starting at sources."""
+    return nx.betweenness_centrality_subset(_betweenness_graph, sources, list(_betweenness_graph), normalized=False)
+
+def _parallel_betweenness_centrality(G_undirected, workers=0):
+    """
+    Exact betweenness centrality with the source nodes split across processes.
     
-    # Return statistics
-    original_edges = len(triples) - len(inferred_edges)
-    stats = {
-        "nodes": len(all_nodes),
-        "edges": len(triples),
-        "original_edges": original_edges,
-        "inferred_edges": len(inferred_edges),
-        "communities": len(set(node_communities.values()))
-    }
-    print(f"Graph Statistics: {json.dumps(stats, indent=2)}")
-    return stats
+    Args:
+        G_undirected: Undirected NetworkX graph
+        workers: Number of processes (0 = one per CPU core)
+        
+    Returns:
+        Dictionary of normalized betweenness centrality, as nx.betweenness_centrality
+    """
+    workers = workers or os.cpu_count() or 1
+    nodes = list(G_undirected)
+    n = len(nodes)
+    if workers == 1 or n < 3:
+        return nx.betweenness_centrality(G_undirected)
+    
+    # Several batches per process even out the uneven cost of the sources
+    batch_size = max(1, n // (workers * 4))
+    batches = [nodes[i:i + batch_size] for i in range(0, n, batch_size)]
+    
+    betweenness = dict.fromkeys(nodes, 0.0)
+    with multiprocessing.Pool(workers, initializer=_init_betweenness_worker, initargs=(G_undirected,)) as pool:
+        for partial in pool.imap_unordered(_betweenness_from_sources, batches):
+            for node, value in partial.items():
+                betweenness[node] += value
+    
+    # Same normalization as nx.betweenness_centrality for undirected graphs
+    scale = 2 / ((n - 1) * (n - 2))
+    return {node: value * scale for node, value in betweenness.items()}
 
-def _calculate_centrality_metrics(G_undirected, all_nodes):
-    """Calculate centrality metrics for the graph nodes."""
-    # Betweenness centrality - nodes that bridge communities are more important
-    betweenness = nx.betweenness_centrality(G_undirected)
+def _calculate_centrality_metrics(G_undirected, all_nodes, visualization_config=None):
+    """
+    Calculate centrality metrics for the graph nodes.
+    
+    The [visualization] centrality option selects how betweenness is computed:
+    "exact" (default), "approximate" (sampled from centrality_samples pivot
+    nodes), "parallel" (exact, split across centrality_workers processes) or
+    "none" (node sizes from degree only).
+    """
+    visualization_config = visualization_config or {}
+    mode = visualization_config.get("centrality", "exact")
     
     # Degree centrality - nodes with more connections are more important
     degree = dict(G_undirected.degree())
     
+    if mode == "none":
+        return {"betweenness": {}, "degree": degree, "eigenvector": {}}
+    
+    # Betweenness centrality - nodes that bridge communities are more important
+    if mode == "approximate":
+        samples = visualization_config.get("centrality_samples", 256)
+        if samples < G_undirected.number_of_nodes():
+            betweenness = nx.betweenness_centrality(G_undirected, k=samples, seed=42)
+        else:
+            betweenness = nx.betweenness_centrality(G_undirected)
+    elif mode == "parallel":
+        betweenness = _parallel_betweenness_centrality(G_undirected, visualization_config.get("centrality_workers", 0))
+    else:
+        betweenness = nx.betweenness_centrality(G_undirected)
+    
     # Eigenvector centrality - nodes connected to high-value nodes are more important
     try:
         eigenvector = nx.eigenvector_centrality(G_undirected, max_iter=1000)
@@ -246,7 +343,8 @@ def _add_nodes_and_edges_to_network(net, G):
             title=str(node_data.get('title', node_id)),  # Ensure title is a string
             shape="dot",
             size=node_data.get('size', 10),
-            font={'color': '#000000'}  # Explicitly set font color to black
+            font={'color': '#000000'},  # Explicitly set font color to black
+            **({'x': node_data['x'], 'y': node_data['y']} if 'x' in node_data else {})  # Precomputed layout
         )
     
     # Add edges with all their attributes
@@ -330,6 +428,208 @@ def _get_visualization_options(edge_smooth=False):
         }
     }
 
+def _iter_vis_nodes(all_nodes, node_communities, node_sizes, degree, colors, positions=None):
+    """Yield the vis.js node records, as _add_nodes_and_edges_to_network would add them."""
+    for node in all_nodes:
+        if not node:
+            continue
+        community = node_communities[node]
+        record = {
+            "id": node,
+            "label": str(node),
+            "title": f"{node} - Connections: {degree.get(node, 0)}",
+            "color": colors[community % len(colors)],
+            "shape": "dot",
+            "size": node_sizes[node],
+            "font": {"color": "#000000"},
+        }
+        if positions:
+            record["x"], record["y"] = positions[node]
+        yield record
+
+def _iter_vis_edges(triples):
+    """
+    Yield the vis.js edge records of the triples.
+    
+    Like a NetworkX DiGraph, repeated subject-object pairs give a single edge
+    at the position of the first one, labeled by the last one.
+    """
+    last_index = {}
+    for i, triple in enumerate(triples):
+        if triple["subject"] and triple["object"]:
+            last_index[(triple["subject"], triple["object"])] = i
+    
+    for i in last_index.values():
+        triple = triples[i]
+        edge = {
+            "from": triple["subject"],
+            "to": triple["object"],
+            "title": triple["predicate"],
+            "label": triple["predicate"],
+            "arrows": "to",
+        }
+        
+        # Dashed, lighter lines for inferred relationships
+        if triple.get("inferred", False):
+            edge["dashes"] = True
+            edge["color"] = "#555555"
+        yield edge
+
+def _script_json(value):
+    """Serialize a value to JSON that is safe inside a <script> element."""
+    return json.dumps(value, ensure_ascii=False).replace("</", "<\\/")
+
+def _write_json_array(f, records):
+    """Write records as a JSON array one element at a time."""
+    f.write("[")
+    for i, record in enumerate(records):
+        if i:
+            f.write(", ")
+        f.write(_script_json(record))
+    f.write("]")
+
+def _load_vis_assets():
+    """Load the vis-network script and stylesheet shipped with PyVis."""
+    import pyvis
+    lib_dir = os.path.join(os.path.dirname(pyvis.__file__), 'templates', 'lib', 'vis-9.1.2')
+    with open(os.path.join(lib_dir, 'vis-network.min.js'), 'r', encoding='utf-8') as f:
+        vis_js = f.read()
+    with open(os.path.join(lib_dir, 'vis-network.css'), 'r', encoding='utf-8') as f:
+        vis_css = f.read()
+    return vis_js, vis_css
+
+def _write_vis_html(output_file, title, nodes, edges, options, extra_script="", asset_directory=None):
+    """
+    Write a standalone vis.js page without going through NetworkX and PyVis.
+    
+    Args:
+        output_file: HTML file to save the visualization
+        title: Page title
+        nodes: Iterable of vis.js node records
+        edges: Iterable of vis.js edge records
+        options: vis.js network options
+        extra_script: HTML inserted after the network is drawn
+        asset_directory: Directory next to output_file to copy the vis.js assets to,
+                         instead of inlining them (optional)
+    """
+    page_path = os.path.join(os.path.dirname(__file__), 'templates', 'network_page.html')
+    with open(page_path, 'r', encoding='utf-8') as f:
+        page = f.read()
+    
+    # Split around the data placeholders so nodes and edges are streamed to the file
+    head, rest = page.split('{{ nodes }}', 1)
+    middle, tail = rest.split('{{ edges }}', 1)
+    
+    vis_js, vis_css = _load_vis_assets()
+    if asset_directory:
+        directory = os.path.join(os.path.dirname(os.path.abspath(output_file)), asset_directory)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'vis-network.min.js'), 'w', encoding='utf-8') as f:
+            f.write(vis_js)
+        with open(os.path.join(directory, 'vis-network.css'), 'w', encoding='utf-8') as f:
+            f.write(vis_css)
+        vis_assets = (f'<link rel="stylesheet" href="{asset_directory}/vis-network.css" />\n'
+                      f'        <script src="{asset_directory}/vis-network.min.js"></script>')
+    else:
+        vis_assets = f'<style>{vis_css}</style>\n        <script>{vis_js}</script>'
+    
+    head = (head
+            .replace('{{ title }}', title)
+            .replace('{{ graph_template }}', _load_html_template())
+            .replace('{{ vis_assets }}', vis_assets))
+    tail = (tail
+            .replace('{{ options }}', _script_json(options))
+            .replace('{{ extra_script }}', extra_script))
+    
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(head)
+        _write_json_array(f, nodes)
+        f.write(middle)
+        _write_json_array(f, edges)
+        f.write(tail)
+    
+    print(f"Knowledge graph visualization saved to {output_file}")
+
+def _write_community_viewer(output_file, title, triples, all_nodes, node_communities, node_sizes, degree, colors, options, positions=None):
+    """
+    Write a level-of-detail viewer: an overview page with one node per community
+    and one sidecar JSON file per community, loaded when it is expanded.
+    
+    The sidecar files and the vis.js assets are written to a "<name>_communities"
+    directory next to output_file.
+    """
+    asset_directory = os.path.splitext(os.path.basename(output_file))[0] + "_communities"
+    directory = os.path.join(os.path.dirname(os.path.abspath(output_file)), asset_directory)
+    os.makedirs(directory, exist_ok=True)
+    
+    # Split nodes and edges by community
+    members = {}
+    for record in _iter_vis_nodes(all_nodes, node_communities, node_sizes, degree, colors, positions):
+        members.setdefault(node_communities[record["id"]], []).append(record)
+    internal_edges = {community: [] for community in members}
+    external_edges = {community: [] for community in members}
+    link_counts = {}
+    for edge in _iter_vis_edges(triples):
+        source, target = node_communities[edge["from"]], node_communities[edge["to"]]
+        if source == target:
+            internal_edges[source].append(edge)
+        else:
+            external_edges[source].append({"edge": edge, "otherCommunity": target, "otherEnd": "to"})
+            external_edges[target].append({"edge": edge, "otherCommunity": source, "otherEnd": "from"})
+            pair = (min(source, target), max(source, target))
+            link_counts[pair] = link_counts.get(pair, 0) + 1
+    
+    for community, records in members.items():
+        with open(os.path.join(directory, f"community_{community}.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "community": community,
+                "nodes": records,
+                "edges": internal_edges[community],
+                "external": external_edges[community],
+            }, f, ensure_ascii=False)
+    
+    # One overview node per community, labeled by its best connected member
+    largest = max((len(records) for records in members.values()), default=1)
+    overview_nodes = []
+    for community, records in sorted(members.items()):
+        hub = max(records, key=lambda record: degree.get(record["id"], 0))
+        node = {
+            "id": f"community:{community}",
+            "label": f"{hub['label']} (+{len(records) - 1})" if len(records) > 1 else hub["label"],
+            "title": f"Community {community}: {len(records)} nodes - double-click to expand",
+            "color": colors[community % len(colors)],
+            "shape": "dot",
+            "size": 10 + 40 * (len(records) / largest) ** 0.5,
+            "font": {"color": "#000000"},
+        }
+        if positions:
+            node["x"] = sum(record["x"] for record in records) / len(records)
+            node["y"] = sum(record["y"] for record in records) / len(records)
+        overview_nodes.append(node)
+    
+    overview_edges = [
+        {
+            "from": f"community:{source}",
+            "to": f"community:{target}",
+            "label": str(count),
+            "title": f"{count} relationships",
+            "width": 1 + min(count, 20) / 4,
+        }
+        for (source, target), count in sorted(link_counts.items())
+    ]
+    
+    script_path = os.path.join(os.path.dirname(__file__), 'templates', 'community_viewer.js')
+    with open(script_path, 'r', encoding='utf-8') as f:
+        viewer_script = f.read().replace('{{ community_directory }}', asset_directory)
+    
+    _write_vis_html(
+        output_file, title, overview_nodes, overview_edges, options,
+        extra_script=f'<script type="text/javascript">\n{viewer_script}</script>',
+        asset_directory=asset_directory,
+    )
+    print(f"Community files saved to {directory}")
+    print("Serve the output folder over HTTP to expand communities, e.g. `python -m http.server`")
+
 def _save_and_modify_html(net, output_file, community_count, all_nodes, triples):
     """Save the network as HTML and modify with custom template."""
     # Instead of letting PyVis write to a file, we'll access its HTML directly
@@ -0,0 +1,50 @@
+"""Recall of the candidate blocking used by sharded resolution."""
+import random
+
+from knowledge_graph.blocking import plan_shards, text_blocking_keys
+
+
+def _zipf_names(count, rng, vocabulary=400, exponent=1.1):
+    """Draw distinct multi-syllable names from a Zipf-distributed syllable vocabulary."""
+    onsets = ["b", "c", "d", "g", "h", "k", "l", "m", "n", "ph", "qu", "s", "t", "th", "tr", "v", "x"]
+    rhymes = ["a", "an", "anh", "ao", "at", "en", "ien", "inh", "o", "oan", "ong", "u", "uan", "ung", "uy", "y"]
+    syllables = [onset + rhyme for onset in onsets for rhyme in rhymes][:vocabulary]
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(syllables))]
+    
+    names = set()
+    while len(names) < count:
+        names.add(" ".join(rng.choices(syllables, weights, k=rng.randint(2, 3))))
+    return sorted(names)
+
+
+def test_plan_shards_keeps_obvious_duplicates_together():
+    rng = random.Random(0)
+    names = _zipf_names(8000, rng)
+    bases = rng.sample(names, 300)
+    variants = {base: f"nước {base}" for base in bases}
+    items = set(names) | set(variants.values())
+    
+    shards = plan_shards({item: text_blocking_keys(item) for item in items}, max_shard_size=40)
+    
+    shard_of = {}
+    for index, shard in enumerate(shards):
+        assert len(shard) <= 40
+        for item in shard:
+            assert item not in shard_of
+            shard_of[item] = index
+    together = sum(1 for base, variant in variants.items() if base in shard_of and shard_of.get(variant) == shard_of[base])
+    assert together >= 0.95 * len(variants)
+
+
+def test_plan_shards_groups_items_sharing_only_common_keys():
+    # Every key is shared by more items than max_key_frequency
+    item_keys = {f"item {i}": {("word", "common"), ("word", f"group {i % 3}")} for i in range(30)}
+    shards = plan_shards(item_keys, max_shard_size=10, max_key_frequency=5)
+    
+    assert {item for shard in shards for item in shard} == set(item_keys)
+    assert all(len(shard) <= 10 for shard in shards)
+
+
+def test_plan_shards_leaves_out_items_without_shared_keys():
+    item_keys = {"a": {("word", "x")}, "b": {("word", "x")}, "c": {("word", "y")}}
+    assert plan_shards(item_keys) == [["a", "b"]]
@@ -0,0 +1,137 @@
+"""State machine of the circuit breaker and its use by the retry logic."""
+import time
+
+import pytest
+
+from knowledge_graph.backends import Response
+from knowledge_graph.llm import CircuitBreaker, _Admit, _Post, _Sleep, _call_llm_steps
+
+
+def _open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=2, failure_rate=0.5, window=4, reset_timeout=reset_timeout,
+                             release_spread=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def _try_admit(breaker):
+    with breaker.condition:
+        return breaker._try_admit()
+
+
+class _CountingKeys:
+    """Key manager stub recording when budget is charged."""
+    
+    def __init__(self):
+        self.charges = 0
+    
+    def get_next_available_key(self, estimated_tokens=0, exclude=()):
+        self.charges += 1
+        return "key", 0
+    
+    def mark_key_rate_limited(self, api_key, retry_after=None):
+        pass
+
+
+def test_breaker_opens_on_failure_threshold_and_rate():
+    breaker = CircuitBreaker(failure_threshold=2, failure_rate=0.5, window=4)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    # Two failures among the last four responses, but only a quarter of them
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_statistics()["trips"] == 1
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = _open_breaker()
+    admitted, probe, wait_time = _try_admit(breaker)
+    assert not admitted and wait_time > 0
+    
+    time.sleep(0.06)
+    assert _try_admit(breaker)[:2] == (True, True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert _try_admit(breaker)[:2] == (False, False)
+    
+    # Responses of other callers still in flight do not close the circuit
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    
+    breaker.record_success(probe=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.acquire() == (False, False)
+
+
+def test_failed_probe_doubles_the_open_time():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.acquire() == (True, False)
+    
+    breaker.record_failure(probe=True)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_for == 0.1
+    assert breaker.get_statistics()["trips"] == 2
+    
+    time.sleep(0.11)
+    assert breaker.acquire() == (True, False)
+    breaker.record_success(probe=True)
+    assert breaker.open_for == breaker.reset_timeout
+
+
+def test_abandoned_probe_lets_the_next_caller_probe():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert _try_admit(breaker)[:2] == (True, True)
+    assert _try_admit(breaker)[:2] == (False, False)
+    
+    breaker.abandon_probe()
+    assert _try_admit(breaker)[:2] == (True, True)
+
+
+def test_callers_are_admitted_before_charging_a_key():
+    breaker = _open_breaker()
+    keys = _CountingKeys()
+    steps = _call_llm_steps(keys, breaker=breaker)
+    
+    assert isinstance(next(steps), _Admit)
+    assert keys.charges == 0
+    assert isinstance(steps.send(breaker.acquire()), _Post)
+    assert keys.charges == 1
+    
+    with pytest.raises(StopIteration) as done:
+        steps.send(Response(200, {"choices": [{"message": {"content": "ok"}}]}, ""))
+    assert done.value.value == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_is_abandoned():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    steps = _call_llm_steps(_CountingKeys(), breaker=breaker)
+    next(steps)
+    assert isinstance(steps.send(breaker.acquire()), _Post)
+    
+    steps.close()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert _try_admit(breaker)[:2] == (True, True)
+
+
+def test_server_error_backoff_is_capped():
+    steps = _call_llm_steps(_CountingKeys(), max_retries=20, base_retry_delay=5, max_retry_delay=60)
+    step = next(steps)
+    waits = []
+    for _ in range(10):
+        assert isinstance(step, _Post)
+        step = steps.send(Response(503, None, "unavailable"))
+        while isinstance(step, _Sleep):
+            waits.append(step.seconds)
+            step = steps.send(None)
+    assert max(waits) <= 60 * 1.2